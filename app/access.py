@@ -0,0 +1,126 @@
+from fastapi import HTTPException
+from sqlalchemy import exists, or_, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from . import models
+
+# -----------------------------
+# Access rules
+# -----------------------------
+# Each rule is a boolean SQL expression (an EXISTS over the foreign-key
+# indexes), so checking "may user X see lesson Y" is one small indexed query
+# instead of loading lesson -> course -> classroom -> roster into the session.
+# Rules are built with correlate(None) so they can sit next to the object
+# they guard in the same SELECT (see authorize()).
+enrollments = models.classroom_students
+
+
+def _exists(*criteria):
+    return exists().where(*criteria).correlate(None)
+
+
+def object_exists(model, object_id: int):
+    return _exists(model.id == object_id)
+
+
+# Classrooms
+def owns_classroom(user_id: int, classroom_id: int):
+    return _exists(models.Classroom.id == classroom_id, models.Classroom.instructor_id == user_id)
+
+def enrolled_in_classroom(user_id: int, classroom_id: int):
+    return _exists(enrollments.c.classroom_id == classroom_id, enrollments.c.student_id == user_id)
+
+def can_view_classroom(user_id: int, classroom_id: int):
+    return or_(owns_classroom(user_id, classroom_id), enrolled_in_classroom(user_id, classroom_id))
+
+
+# Courses
+def owns_course(user_id: int, course_id: int):
+    return _exists(
+        models.Course.id == course_id,
+        models.Classroom.id == models.Course.classroom_id,
+        models.Classroom.instructor_id == user_id,
+    )
+
+def enrolled_in_course(user_id: int, course_id: int):
+    return _exists(
+        models.Course.id == course_id,
+        enrollments.c.classroom_id == models.Course.classroom_id,
+        enrollments.c.student_id == user_id,
+    )
+
+def can_view_course(user_id: int, course_id: int):
+    return or_(owns_course(user_id, course_id), enrolled_in_course(user_id, course_id))
+
+
+# Lessons
+def owns_lesson(user_id: int, lesson_id: int):
+    return _exists(
+        models.Lesson.id == lesson_id,
+        models.Course.id == models.Lesson.course_id,
+        models.Classroom.id == models.Course.classroom_id,
+        models.Classroom.instructor_id == user_id,
+    )
+
+def enrolled_in_lesson(user_id: int, lesson_id: int):
+    return _exists(
+        models.Lesson.id == lesson_id,
+        models.Course.id == models.Lesson.course_id,
+        enrollments.c.classroom_id == models.Course.classroom_id,
+        enrollments.c.student_id == user_id,
+    )
+
+def can_view_lesson(user_id: int, lesson_id: int):
+    return or_(owns_lesson(user_id, lesson_id), enrolled_in_lesson(user_id, lesson_id))
+
+
+# Sessions
+def owns_session(user_id: int, session_id: int):
+    return _exists(
+        models.Session.id == session_id,
+        models.Lesson.id == models.Session.lesson_id,
+        models.Course.id == models.Lesson.course_id,
+        models.Classroom.id == models.Course.classroom_id,
+        models.Classroom.instructor_id == user_id,
+    )
+
+def started_session(user_id: int, session_id: int):
+    return _exists(models.Session.id == session_id, models.Session.student_id == user_id)
+
+
+# -----------------------------
+# Checks
+# -----------------------------
+def allowed(db: Session, rule) -> bool:
+    return bool(db.execute(select(rule)).scalar())
+
+async def aallowed(db: AsyncSession, rule) -> bool:
+    return bool((await db.execute(select(rule))).scalar())
+
+
+def _authorize_query(model, object_id: int, rule, options, entity):
+    query = select(entity if entity is not None else model, rule if rule is not None else true()).where(model.id == object_id)
+    return query.options(*options) if options else query
+
+def _authorized(row, model, forbidden: str):
+    # No row: the object doesn't exist. Row with False: it exists but the rule failed.
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"{model.__name__} not found")
+    obj, ok = row
+    if not ok:
+        raise HTTPException(status_code=403, detail=forbidden)
+    return obj
+
+
+def authorize(db: Session, model, object_id: int, rule, forbidden: str = "Not allowed", options=(), entity=None):
+    """
+    Load `model` #object_id and evaluate `rule` in the same query. Raises 404
+    if it doesn't exist and 403 if the rule is false. rule=None only loads.
+    Pass `entity` (e.g. a single column) to load that instead of the object.
+    """
+    row = db.execute(_authorize_query(model, object_id, rule, options, entity)).first()
+    return _authorized(row, model, forbidden)
+
+async def aauthorize(db: AsyncSession, model, object_id: int, rule, forbidden: str = "Not allowed", options=(), entity=None):
+    row = (await db.execute(_authorize_query(model, object_id, rule, options, entity))).first()
+    return _authorized(row, model, forbidden)
@@ -1,76 +1,193 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-import os
-from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+import threading
+import time
+from .config import settings
+from . import metrics
+
+
+STUDENT_TUTOR_SYSTEM_MESSAGE = (
+    "You are a supportive Academic Tutor. Your task is to answer student questions "
+    "based strictly on the provided lesson content. \n\n"
+    "INSTRUCTIONS:\n"
+    "1. Use the 'LESSON CONTENT' below to form your answer.\n"
+    "2. If the answer is not in the text, say 'That isn't covered in this lesson, but based on general knowledge...' and then explain.\n"
+    "3. Use Markdown for clarity (bullet points, bold text).\n"
+    "4. Keep the tone encouraging and professional."
+)
+
+# This template combines the database content with the student's actual query
+STUDENT_TUTOR_USER_TEMPLATE = (
+    "COURSE TITLE: {title}\n"
+    "LESSON CONTENT:\n{content}\n\n"
+    "STUDENT QUESTION: {question}"
+)
+
+# The prompt changes based on who is asking!
+INSTRUCTOR_SYSTEM_MESSAGE = (
+    "You are an expert curriculum designer. Create a comprehensive lesson plan "
+    "for a student. Use Markdown formatting. Include: \n"
+    "1. A catchy Title\n"
+    "2. Learning Objectives\n"
+    "3. Detailed Content divided into sections\n"
+    "4. A 'Key Takeaways' summary at the end."
+)
+
+PEER_TUTOR_SYSTEM_MESSAGE = "You are a helpful peer tutor. Explain this topic clearly and simply."
+
+
+class LLMMetrics(BaseCallbackHandler):
+    """Latency, outcome and token usage of every LLM call one chain makes, for /metrics."""
+
+    run_inline = True # just counters: no executor hop on async calls
+
+    def __init__(self, prompt: str, model: str):
+        self.prompt = prompt
+        self.model = model
+        self._started = {} # run_id -> perf_counter at start
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, "ok")
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if not usage:
+                    continue
+                for direction in ("input", "output"):
+                    metrics.llm_tokens.inc(
+                        usage.get(f"{direction}_tokens", 0), prompt=self.prompt, model=self.model, direction=direction
+                    )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, "error")
+
+    def _finish(self, run_id, status: str):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            metrics.llm_request_duration.observe(time.perf_counter() - started, prompt=self.prompt, model=self.model)
+        metrics.llm_requests.inc(prompt=self.prompt, model=self.model, status=status)
+
+
+class TutorAgent:
+    """
+    Long-lived LLM provider. Prompt templates are built once here and the
+    Gemini clients/chains are built lazily on first use, then reused by every
+    request (sync and async) for the life of the process.
+    """
+
+    def __init__(self, api_key: str | None = None, model: str | None = None):
+        self._api_key = api_key
+        self._model = model or settings.LLM_MODEL
+        self._lock = threading.Lock()
+        self._chains = {}
+
+        self._prompts = {
+            "student_tutor": ChatPromptTemplate.from_messages([
+                ("system", STUDENT_TUTOR_SYSTEM_MESSAGE),
+                ("human", STUDENT_TUTOR_USER_TEMPLATE)
+            ]),
+            "instructor": ChatPromptTemplate.from_messages([
+                ("system", INSTRUCTOR_SYSTEM_MESSAGE),
+                ("human", "The topic is: {user_input}")
+            ]),
+            "peer_tutor": ChatPromptTemplate.from_messages([
+                ("system", PEER_TUTOR_SYSTEM_MESSAGE),
+                ("human", "The topic is: {user_input}")
+            ]),
+        }
+
+    def _build_llm(self, name: str):
+        api_key = self._api_key or settings.GOOGLE_API_KEY
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found. Ensure it is set in your .env file.")
+
+        if name == "student_tutor":
+            return ChatGoogleGenerativeAI(
+                model=self._model,
+                temperature=0.3, # Lower temperature for more factual, less "creative" answers
+                google_api_key=api_key
+            )
+        return ChatGoogleGenerativeAI(
+            model=self._model,
+            temperature=0.7,
+            google_api_key=api_key,
+            model_kwargs={"api_version": "v1"}
+        )
+
+    def _chain(self, name: str):
+        chain = self._chains.get(name)
+        if chain is None:
+            with self._lock:
+                chain = self._chains.get(name)
+                if chain is None:
+                    chain = self._prompts[name] | self._build_llm(name) | StrOutputParser()
+                    if settings.METRICS_ENABLED:
+                        chain = chain.with_config(callbacks=[LLMMetrics(name, self._model)])
+                    self._chains[name] = chain
+        return chain
+
+    @staticmethod
+    def _tutor_chain_name(user_role: str) -> str:
+        return "instructor" if user_role == "instructor" else "peer_tutor"
+
+    def student_tutor_response(self, student_question: str, lesson_title: str, lesson_content: str) -> str:
+        return self._chain("student_tutor").invoke({
+            "title": lesson_title,
+            "content": lesson_content,
+            "question": student_question
+        })
+
+    async def astudent_tutor_response(self, student_question: str, lesson_title: str, lesson_content: str) -> str:
+        return await self._chain("student_tutor").ainvoke({
+            "title": lesson_title,
+            "content": lesson_content,
+            "question": student_question
+        })
+
+    async def astream_student_tutor_response(self, student_question: str, lesson_title: str, lesson_content: str):
+        async for chunk in self._chain("student_tutor").astream({
+            "title": lesson_title,
+            "content": lesson_content,
+            "question": student_question
+        }):
+            yield chunk
+
+    def tutor_response(self, prompt_text: str, user_role: str) -> str:
+        return self._chain(self._tutor_chain_name(user_role)).invoke({"user_input": prompt_text})
+
+    async def atutor_response(self, prompt_text: str, user_role: str) -> str:
+        return await self._chain(self._tutor_chain_name(user_role)).ainvoke({"user_input": prompt_text})
+
+    async def astream_tutor_response(self, prompt_text: str, user_role: str):
+        async for chunk in self._chain(self._tutor_chain_name(user_role)).astream({"user_input": prompt_text}):
+            yield chunk
+
+
+agent = TutorAgent()
 
 
-load_dotenv()
 def get_student_tutor_response(student_question: str, lesson_title: str, lesson_content: str):
-    api_key = os.getenv("GOOGLE_API_KEY")
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash", 
-        temperature=0.3, # Lower temperature for more factual, less "creative" answers
-        google_api_key=api_key
-    )
-
-    system_message = (
-        "You are a supportive Academic Tutor. Your task is to answer student questions "
-        "based strictly on the provided lesson content. \n\n"
-        "INSTRUCTIONS:\n"
-        "1. Use the 'LESSON CONTENT' below to form your answer.\n"
-        "2. If the answer is not in the text, say 'That isn't covered in this lesson, but based on general knowledge...' and then explain.\n"
-        "3. Use Markdown for clarity (bullet points, bold text).\n"
-        "4. Keep the tone encouraging and professional."
-    )
-
-    # This template combines the database content with the student's actual query
-    user_template = (
-        "COURSE TITLE: {title}\n"
-        "LESSON CONTENT:\n{content}\n\n"
-        "STUDENT QUESTION: {question}"
-    )
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_message),
-        ("human", user_template)
-    ])
-
-    chain = prompt | llm | StrOutputParser()
-    
-    return chain.invoke({
-        "title": lesson_title,
-        "content": lesson_content,
-        "question": student_question
-    })
+    return agent.student_tutor_response(student_question, lesson_title, lesson_content)
+
+async def aget_student_tutor_response(student_question: str, lesson_title: str, lesson_content: str):
+    return await agent.astudent_tutor_response(student_question, lesson_title, lesson_content)
+
+def astream_student_tutor_response(student_question: str, lesson_title: str, lesson_content: str):
+    return agent.astream_student_tutor_response(student_question, lesson_title, lesson_content)
 
 def get_tutor_response(prompt_text: str, user_role: str):
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY not found. Ensure it is set in your .env file.")
-    llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", 
-    temperature=0.7,
-    google_api_key=api_key,
-    model_kwargs={"api_version": "v1"}
-    )
-    # The prompt changes based on who is asking!
-    if user_role == "instructor":
-        system_message = (
-            "You are an expert curriculum designer. Create a comprehensive lesson plan "
-            "for a student. Use Markdown formatting. Include: \n"
-            "1. A catchy Title\n"
-            "2. Learning Objectives\n"
-            "3. Detailed Content divided into sections\n"
-            "4. A 'Key Takeaways' summary at the end."
-        )
-    else:
-        system_message = "You are a helpful peer tutor. Explain this topic clearly and simply."
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_message),
-        ("human", "The topic is: {user_input}")
-    ])
-    
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({"user_input": prompt_text})
+    return agent.tutor_response(prompt_text, user_role)
+
+async def aget_tutor_response(prompt_text: str, user_role: str):
+    return await agent.atutor_response(prompt_text, user_role)
 
+def astream_tutor_response(prompt_text: str, user_role: str):
+    return agent.astream_tutor_response(prompt_text, user_role)
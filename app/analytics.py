@@ -0,0 +1,295 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete, distinct, func, insert, inspect, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from . import models
+
+# -----------------------------
+# Session analytics rollups
+# -----------------------------
+# Every session write adjusts four small counters tables (see models.py):
+#   lesson_stats          sessions started, active now, ended + total duration, per lesson
+#   lesson_daily_stats    sessions started per lesson per UTC day
+#   lesson_hourly_stats   sessions started per lesson per UTC hour of day
+#   lesson_student_stats  sessions per lesson per student (distinct students)
+# The routes call these helpers before committing, so a rollback undoes both.
+
+ROLLUPS = (models.LessonStats, models.LessonDailyStats, models.LessonHourlyStats, models.LessonStudentStats)
+UPSERTS = {"sqlite": sqlite_insert, "postgresql": pg_insert}
+
+
+def classroom_of(db, lesson_id: int) -> int | None:
+    return db.execute(
+        select(models.Course.classroom_id)
+        .join(models.Lesson, models.Lesson.course_id == models.Course.id)
+        .where(models.Lesson.id == lesson_id)
+    ).scalar()
+
+
+def _bump(db, model, key: dict, classroom_id: int, **deltas):
+    """Add `deltas` to the counters of one rollup row, creating it if needed."""
+    table = model.__table__
+    upsert = UPSERTS.get(db.get_bind().dialect.name)
+    if upsert is not None:
+        stmt = upsert(table).values(**key, classroom_id=classroom_id, **deltas)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_={name: table.c[name] + stmt.excluded[name] for name in deltas},
+        ))
+        return
+    updated = db.execute(
+        update(table)
+        .where(*[table.c[name] == value for name, value in key.items()])
+        .values({name: table.c[name] + delta for name, delta in deltas.items()})
+    ).rowcount
+    if not updated:
+        db.execute(insert(table).values(**key, classroom_id=classroom_id, **deltas))
+
+
+def _count_start(db, classroom_id: int, lesson_id: int, start_time: datetime, sign: int):
+    _bump(db, models.LessonDailyStats, {"lesson_id": lesson_id, "day": start_time.date()}, classroom_id, sessions=sign)
+    _bump(db, models.LessonHourlyStats, {"lesson_id": lesson_id, "hour": start_time.hour}, classroom_id, sessions=sign)
+
+
+def _duration(start_time: datetime | None, end_time: datetime | None) -> int | None:
+    """
+    Seconds a session lasted, or None when there's nothing measured: still
+    open, or expired by the sweeper without any activity (it then ends where
+    it started).
+    """
+    if start_time is None or end_time is None or end_time <= start_time:
+        return None
+    return int((end_time - start_time).total_seconds())
+
+
+def _ended(start_time, end_time, sign: int = 1) -> dict:
+    """The (ended, duration_seconds) contribution of one session, as deltas."""
+    seconds = _duration(start_time, end_time)
+    if seconds is None:
+        return {"ended": 0, "duration_seconds": 0}
+    return {"ended": sign, "duration_seconds": sign * seconds}
+
+
+def _apply(db, session: models.Session, sign: int):
+    classroom_id = classroom_of(db, session.lesson_id)
+    if classroom_id is None: # lesson outside any course: nothing to roll up into
+        return
+    _bump(
+        db, models.LessonStats, {"lesson_id": session.lesson_id}, classroom_id,
+        sessions=sign, active=sign if session.is_active else 0,
+        **_ended(session.start_time, session.end_time, sign)
+    )
+    _count_start(db, classroom_id, session.lesson_id, session.start_time, sign)
+    if session.student_id is not None:
+        _bump(
+            db, models.LessonStudentStats,
+            {"lesson_id": session.lesson_id, "student_id": session.student_id}, classroom_id,
+            sessions=sign
+        )
+
+
+def session_started(db, session: models.Session):
+    _apply(db, session, 1)
+
+
+def session_deleted(db, session: models.Session):
+    _apply(db, session, -1)
+
+
+def session_changed(db, session: models.Session, old_start_time: datetime, old_is_active: bool, old_end_time: datetime | None):
+    """Call after changing a session in place, with the values from before."""
+    if (old_start_time, old_is_active, old_end_time) == (session.start_time, session.is_active, session.end_time):
+        return
+    classroom_id = classroom_of(db, session.lesson_id)
+    if classroom_id is None:
+        return
+    if old_start_time != session.start_time:
+        _count_start(db, classroom_id, session.lesson_id, old_start_time, -1)
+        _count_start(db, classroom_id, session.lesson_id, session.start_time, 1)
+    before = _ended(old_start_time, old_end_time)
+    after = _ended(session.start_time, session.end_time)
+    deltas = {
+        "active": int(session.is_active) - int(old_is_active),
+        **{name: after[name] - before[name] for name in after},
+    }
+    if any(deltas.values()):
+        _bump(db, models.LessonStats, {"lesson_id": session.lesson_id}, classroom_id, **deltas)
+
+
+def sessions_started(db, rows: list[dict]):
+    """
+    session_started for a batch of new active sessions (dicts with lesson_id,
+    student_id, start_time): one upsert per touched counter, not per session.
+    """
+    lesson_ids = {row["lesson_id"] for row in rows}
+    classrooms = dict(db.execute(
+        select(models.Lesson.id, models.Course.classroom_id)
+        .join(models.Course, models.Course.id == models.Lesson.course_id)
+        .where(models.Lesson.id.in_(lesson_ids))
+    ).all())
+    totals, daily, hourly, students = Counter(), Counter(), Counter(), Counter()
+    for row in rows:
+        lesson_id = row["lesson_id"]
+        totals[lesson_id] += 1
+        daily[(lesson_id, row["start_time"].date())] += 1
+        hourly[(lesson_id, row["start_time"].hour)] += 1
+        if row["student_id"] is not None:
+            students[(lesson_id, row["student_id"])] += 1
+    for lesson_id, n in totals.items():
+        if classrooms.get(lesson_id) is not None:
+            _bump(db, models.LessonStats, {"lesson_id": lesson_id}, classrooms[lesson_id], sessions=n, active=n)
+    for (lesson_id, day), n in daily.items():
+        if classrooms.get(lesson_id) is not None:
+            _bump(db, models.LessonDailyStats, {"lesson_id": lesson_id, "day": day}, classrooms[lesson_id], sessions=n)
+    for (lesson_id, hour), n in hourly.items():
+        if classrooms.get(lesson_id) is not None:
+            _bump(db, models.LessonHourlyStats, {"lesson_id": lesson_id, "hour": hour}, classrooms[lesson_id], sessions=n)
+    for (lesson_id, student_id), n in students.items():
+        if classrooms.get(lesson_id) is not None:
+            _bump(
+                db, models.LessonStudentStats, {"lesson_id": lesson_id, "student_id": student_id},
+                classrooms[lesson_id], sessions=n
+            )
+
+
+def sessions_closed(db, closed: list):
+    """Counters for sessions the sweeper closed: (lesson_id, start_time, end_time) rows."""
+    per_lesson = {}
+    for lesson_id, start_time, end_time in closed:
+        deltas = per_lesson.setdefault(lesson_id, {"active": 0, "ended": 0, "duration_seconds": 0})
+        deltas["active"] -= 1
+        for name, delta in _ended(start_time, end_time).items():
+            deltas[name] += delta
+    for lesson_id, deltas in per_lesson.items():
+        classroom_id = classroom_of(db, lesson_id)
+        if classroom_id is not None:
+            _bump(db, models.LessonStats, {"lesson_id": lesson_id}, classroom_id, **deltas)
+
+
+def rebuild(db) -> int:
+    """
+    Recompute every rollup from `sessions` (after a migration, or if the
+    counters were ever bypassed). Returns the number of sessions counted.
+    """
+    for model in ROLLUPS:
+        db.execute(delete(model))
+
+    totals, active, daily, hourly, students = Counter(), Counter(), Counter(), Counter(), Counter()
+    ended, durations = Counter(), Counter()
+    classrooms = {}
+    # Migration 4 runs this before migration 5 adds sessions.end_time
+    connection = db.connection() if isinstance(db, Session) else db
+    columns = {c["name"] for c in inspect(connection).get_columns(models.Session.__tablename__)}
+    end_time = models.Session.end_time if "end_time" in columns else literal(None).label("end_time")
+    rows = db.execute(
+        select(
+            models.Session.lesson_id, models.Session.student_id, models.Session.start_time,
+            models.Session.is_active, end_time, models.Course.classroom_id
+        )
+        .join(models.Lesson, models.Lesson.id == models.Session.lesson_id)
+        .join(models.Course, models.Course.id == models.Lesson.course_id)
+        .where(models.Course.classroom_id.isnot(None), models.Session.start_time.isnot(None))
+        .execution_options(yield_per=1000)
+    )
+    counted = 0
+    for row in rows:
+        counted += 1
+        classrooms[row.lesson_id] = row.classroom_id
+        totals[row.lesson_id] += 1
+        active[row.lesson_id] += 1 if row.is_active else 0
+        seconds = _duration(row.start_time, row.end_time)
+        if seconds is not None:
+            ended[row.lesson_id] += 1
+            durations[row.lesson_id] += seconds
+        daily[(row.lesson_id, row.start_time.date())] += 1
+        hourly[(row.lesson_id, row.start_time.hour)] += 1
+        if row.student_id is not None:
+            students[(row.lesson_id, row.student_id)] += 1
+
+    batches = [
+        (models.LessonStats, [
+            {
+                "lesson_id": lesson_id, "classroom_id": classrooms[lesson_id], "sessions": n,
+                "active": active[lesson_id], "ended": ended[lesson_id], "duration_seconds": durations[lesson_id],
+            }
+            for lesson_id, n in totals.items()
+        ]),
+        (models.LessonDailyStats, [
+            {"lesson_id": lesson_id, "day": day, "classroom_id": classrooms[lesson_id], "sessions": n}
+            for (lesson_id, day), n in daily.items()
+        ]),
+        (models.LessonHourlyStats, [
+            {"lesson_id": lesson_id, "hour": hour, "classroom_id": classrooms[lesson_id], "sessions": n}
+            for (lesson_id, hour), n in hourly.items()
+        ]),
+        (models.LessonStudentStats, [
+            {"lesson_id": lesson_id, "student_id": student_id, "classroom_id": classrooms[lesson_id], "sessions": n}
+            for (lesson_id, student_id), n in students.items()
+        ]),
+    ]
+    for model, values in batches:
+        if values:
+            db.execute(insert(model), values)
+    return counted
+
+
+# -----------------------------
+# Reports
+# -----------------------------
+def report_queries(scope: str, scope_id: int, since: date) -> dict:
+    """
+    The handful of queries behind one report. scope is "lesson_id" or
+    "classroom_id"; every query reads rollup rows only.
+    """
+    def where(model):
+        return getattr(model, scope) == scope_id
+
+    Daily, Hourly, Students = models.LessonDailyStats, models.LessonHourlyStats, models.LessonStudentStats
+    queries = {
+        "totals": select(
+            func.coalesce(func.sum(models.LessonStats.sessions), 0),
+            func.coalesce(func.sum(models.LessonStats.active), 0),
+            func.coalesce(func.sum(models.LessonStats.ended), 0),
+            func.coalesce(func.sum(models.LessonStats.duration_seconds), 0),
+        ).where(where(models.LessonStats)),
+        "students": select(func.count(distinct(Students.student_id))).where(where(Students), Students.sessions > 0),
+        "daily": select(Daily.day, func.sum(Daily.sessions))
+            .where(where(Daily), Daily.day >= since)
+            .group_by(Daily.day),
+        "hourly": select(Hourly.hour, func.sum(Hourly.sessions)).where(where(Hourly)).group_by(Hourly.hour),
+    }
+    if scope == "classroom_id":
+        queries["lessons"] = (
+            select(models.LessonStats.lesson_id, models.LessonStats.sessions, models.LessonStats.active)
+            .where(where(models.LessonStats))
+            .order_by(models.LessonStats.lesson_id)
+        )
+    return queries
+
+
+def build_report(results: dict, since: date) -> dict:
+    sessions, active, ended, duration = results["totals"][0]
+    per_day = {day: n for day, n in results["daily"]}
+    per_hour = {hour: n for hour, n in results["hourly"]}
+    today = datetime.utcnow().date()
+    report = {
+        "sessions_started": sessions,
+        "active_now": active,
+        "distinct_students": results["students"][0][0],
+        "sessions_ended": ended,
+        "average_duration_seconds": round(duration / ended, 1) if ended else None,
+        # Dense series, zeros included, so charts don't have to fill gaps
+        "daily": [
+            {"day": day, "sessions": per_day.get(day, 0)}
+            for day in (since + timedelta(days=i) for i in range((today - since).days + 1))
+        ],
+        "hourly": [per_hour.get(hour, 0) for hour in range(24)],
+    }
+    if "lessons" in results:
+        report["lessons"] = [
+            {"lesson_id": lesson_id, "sessions_started": n, "active_now": a}
+            for lesson_id, n, a in results["lessons"]
+        ]
+    return report
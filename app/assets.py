@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+from .compression import brotli, choose_encoding
+from .config import settings
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "static")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache" # un-fingerprinted URLs: always check the ETag
+
+# Worth compressing ahead of time; images and fonts are already compressed
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+class AssetManifest:
+    """
+    Content-hash fingerprints for everything under app/static.
+
+    `logo.png` is published as `logo.<hash>.png`; that URL never changes
+    meaning, so browsers may cache it forever. Compressible files also get
+    their gzip/brotli bodies built once here instead of per request.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.urls = {}      # "logo.png" -> "logo.3f2a9c1b0d4e.png"
+        self.originals = {} # the other way round
+        self.variants = {}  # ("app.js", "br") -> compressed bytes
+        self.scan()
+
+    def scan(self):
+        self.urls.clear()
+        self.originals.clear()
+        self.variants.clear()
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                name = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    content = f.read()
+                digest = hashlib.sha256(content).hexdigest()[:12]
+                stem, ext = os.path.splitext(name)
+                fingerprinted = f"{stem}.{digest}{ext}"
+                self.urls[name] = fingerprinted
+                self.originals[fingerprinted] = name
+
+                media_type = mimetypes.guess_type(name)[0] or ""
+                if media_type.startswith(COMPRESSIBLE_TYPES) and len(content) >= settings.COMPRESSION_MIN_SIZE:
+                    self.variants[(name, "gzip")] = gzip.compress(content, compresslevel=9, mtime=0)
+                    if brotli is not None:
+                        self.variants[(name, "br")] = brotli.compress(content, quality=11)
+
+    def url(self, name: str) -> str:
+        return "/static/" + self.urls.get(name, name)
+
+
+class FingerprintedStaticFiles(StaticFiles):
+    """StaticFiles that understands fingerprinted names and serves precompressed variants."""
+
+    def __init__(self, manifest: AssetManifest, **kwargs):
+        super().__init__(directory=manifest.directory, **kwargs)
+        self.manifest = manifest
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        original = self.manifest.originals.get(path)
+        name = original or path
+        cache_control = IMMUTABLE if original else REVALIDATE
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        body = self.manifest.variants.get((name, encoding)) if encoding else None
+        if body is not None and scope["method"] in ("GET", "HEAD"):
+            return Response(
+                body,
+                media_type=mimetypes.guess_type(name)[0],
+                headers={
+                    "Content-Encoding": encoding,
+                    "Cache-Control": cache_control,
+                    "Vary": "Accept-Encoding",
+                },
+            )
+
+        response = await super().get_response(name, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = cache_control
+        return response
+
+
+manifest = AssetManifest(STATIC_DIR)
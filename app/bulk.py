@@ -0,0 +1,347 @@
+import asyncio
+import codecs
+import csv
+import json
+import zlib
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, EmailStr, ValidationError
+from sqlalchemy import insert, or_, select
+from .config import settings
+from .database import SessionLocal
+from .hash import ahash_passwords
+from .principals import invalidate_user
+from . import models
+
+# -----------------------------
+# Streaming record parsing
+# -----------------------------
+# Bodies are read chunk by chunk and cut into lines, so a 5,000-row upload
+# never sits in memory as one string. One record per line: CSV with a header
+# row (Content-Type text/csv) or NDJSON (anything else), optionally gzip'd.
+
+
+def is_gzipped(request: Request) -> bool:
+    return (
+        request.headers.get("content-encoding", "").lower() == "gzip"
+        or request.headers.get("content-type", "").split(";")[0].strip() in ("application/gzip", "application/x-gzip")
+    )
+
+
+async def iter_body(request: Request):
+    """Raw body chunks, gunzipped on the fly when the upload is gzip'd."""
+    if not is_gzipped(request):
+        async for chunk in request.stream():
+            yield chunk
+        return
+    inflater = zlib.decompressobj(wbits=31)
+    try:
+        async for chunk in request.stream():
+            # Bounded output per step, so a tiny "zip bomb" can't blow up memory in one go
+            data = inflater.decompress(chunk, 1 << 20)
+            while data:
+                yield data
+                data = inflater.decompress(inflater.unconsumed_tail, 1 << 20)
+        yield inflater.flush()
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Body is not valid gzip")
+
+
+async def iter_lines(request: Request):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in iter_body(request):
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_records(request: Request, truncate: bool = False):
+    """
+    Yield (row number, dict) for every non-blank record in the body. Past
+    BULK_MAX_ROWS rows it's a 413, or with `truncate` the rest is ignored and
+    request.state.truncated is set: imports that commit batch by batch must
+    truncate, a 413 would come after some rows were already written.
+    """
+    is_csv = request.headers.get("content-type", "").split(";")[0].strip() == "text/csv"
+    header = None
+    number = 0
+    async for line in iter_lines(request):
+        if not line.strip():
+            continue
+        if is_csv and header is None:
+            header = [name.strip() for name in next(csv.reader([line]))]
+            continue
+        number += 1
+        if number > settings.BULK_MAX_ROWS:
+            if truncate:
+                request.state.truncated = True
+                return
+            raise HTTPException(status_code=413, detail=f"At most {settings.BULK_MAX_ROWS} rows per import")
+        if is_csv:
+            values = next(csv.reader([line]))
+            yield number, {name: value.strip() for name, value in zip(header, values) if value.strip() != ""}
+        else:
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, e
+                continue
+            yield number, record if isinstance(record, dict) else ValueError("Expected a JSON object")
+
+
+async def batches(records, size: int = None):
+    size = size or settings.BULK_BATCH_SIZE
+    batch = []
+    async for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _error(number: int, message: str, **extra) -> dict:
+    return {"row": number, "status": "error", "error": message, **extra}
+
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+
+
+def summarize(request: Request, results: list[dict]) -> dict:
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {
+        "total": len(results),
+        "counts": counts,
+        "truncated": getattr(request.state, "truncated", False), # rows past BULK_MAX_ROWS weren't read
+        "rows": sorted(results, key=lambda r: r["row"]),
+    }
+
+
+# -----------------------------
+# Users
+# -----------------------------
+class UserRow(BaseModel):
+    username: str
+    email: EmailStr
+    password: str | None = None
+    hashed_password: str | None = None # already bcrypt'ed, e.g. from another system
+    role: str = "student"
+    classroom_id: int | None = None
+
+
+async def import_users(request: Request) -> dict:
+    """
+    Create users (and optionally enroll them) from the request body. Each
+    batch is validated, hashed in parallel and written in one transaction.
+    """
+    results = []
+    async for batch in batches(iter_records(request, truncate=True)):
+        rows = []
+        for number, record in batch:
+            if isinstance(record, Exception):
+                results.append(_error(number, f"Unreadable row: {record}"))
+                continue
+            try:
+                row = UserRow.model_validate(record)
+            except ValidationError as e:
+                results.append(_error(number, _validation_message(e), username=record.get("username")))
+                continue
+            if not row.password and not row.hashed_password:
+                results.append(_error(number, "password or hashed_password is required", username=row.username))
+                continue
+            if row.hashed_password and not row.hashed_password.startswith(("$2a$", "$2b$", "$2y$")):
+                results.append(_error(number, "hashed_password must be a bcrypt hash", username=row.username))
+                continue
+            rows.append((number, row))
+
+        accepted, rejected = await asyncio.to_thread(_check_users, rows)
+        results.extend(rejected)
+        if not accepted:
+            continue
+
+        # Temporary passwords get the cheaper bulk cost; the first login upgrades them
+        to_hash = [row.password for _, row in accepted if not row.hashed_password]
+        hashed = iter(await ahash_passwords(to_hash, rounds=settings.BULK_BCRYPT_ROUNDS))
+        hashes = [row.hashed_password or next(hashed) for _, row in accepted]
+
+        results.extend(await asyncio.to_thread(_insert_users, accepted, hashes))
+    return summarize(request, results)
+
+
+def _check_users(rows: list) -> tuple[list, list[dict]]:
+    """Split a batch into rows we can create and rejections, before spending any time hashing."""
+    accepted, rejected = [], []
+    db = SessionLocal()
+    try:
+        usernames = [row.username for _, row in rows]
+        emails = [row.email for _, row in rows]
+        taken = db.execute(
+            select(models.User.username, models.User.email)
+            .where(or_(models.User.username.in_(usernames), models.User.email.in_(emails)))
+        ).all()
+        roles = set(db.execute(select(models.Role.name)).scalars())
+        classroom_ids = {row.classroom_id for _, row in rows if row.classroom_id is not None}
+        classrooms = set(db.execute(
+            select(models.Classroom.id).where(models.Classroom.id.in_(classroom_ids))
+        ).scalars()) if classroom_ids else set()
+    finally:
+        db.close()
+
+    taken_names = {r.username for r in taken}
+    taken_emails = {r.email for r in taken}
+    for number, row in rows:
+        if row.username in taken_names:
+            rejected.append({"row": number, "status": "skipped", "username": row.username, "error": "Username already registered"})
+        elif row.email in taken_emails:
+            rejected.append({"row": number, "status": "skipped", "username": row.username, "error": "Email already registered"})
+        elif row.role not in roles:
+            rejected.append(_error(number, f"Unknown role '{row.role}'", username=row.username))
+        elif row.classroom_id is not None and row.classroom_id not in classrooms:
+            rejected.append(_error(number, f"Classroom {row.classroom_id} not found", username=row.username))
+        else:
+            # Duplicates inside the same file count as taken too
+            taken_names.add(row.username)
+            taken_emails.add(row.email)
+            accepted.append((number, row))
+    return accepted, rejected
+
+
+def _insert_users(rows: list, hashes: list[str]) -> list[dict]:
+    db = SessionLocal()
+    try:
+        roles = dict(db.execute(select(models.Role.name, models.Role.id)).all())
+        ids = db.execute(
+            insert(models.User).returning(models.User.id, sort_by_parameter_order=True),
+            [
+                {"username": row.username, "email": row.email, "hashed_password": hashed_password}
+                for (_, row), hashed_password in zip(rows, hashes)
+            ]
+        ).scalars().all()
+        db.execute(insert(models.user_roles), [
+            {"user_id": user_id, "role_id": roles[row.role]} for (_, row), user_id in zip(rows, ids)
+        ])
+        enrollments = [
+            {"classroom_id": row.classroom_id, "student_id": user_id}
+            for (_, row), user_id in zip(rows, ids) if row.classroom_id is not None
+        ]
+        if enrollments:
+            db.execute(insert(models.classroom_students), enrollments)
+        db.commit()
+    except Exception as e:
+        # e.g. someone registered one of these usernames meanwhile: the batch is all-or-nothing
+        db.rollback()
+        return [_error(number, f"Batch failed: {e.__class__.__name__}", username=row.username) for number, row in rows]
+    finally:
+        db.close()
+
+    return [
+        {"row": number, "status": "created", "username": row.username, "id": user_id}
+        for (number, row), user_id in zip(rows, ids)
+    ]
+
+
+# -----------------------------
+# Enrollments
+# -----------------------------
+class EnrollmentRow(BaseModel):
+    classroom_id: int
+    student_id: int | None = None
+    username: str | None = None
+
+
+async def import_enrollments(request: Request, instructor_id: int | None) -> dict:
+    """
+    Enroll existing users. instructor_id limits the import to that
+    instructor's classrooms (None for admins).
+    """
+    results = []
+    async for batch in batches(iter_records(request, truncate=True)):
+        rows = []
+        for number, record in batch:
+            if isinstance(record, Exception):
+                results.append(_error(number, f"Unreadable row: {record}"))
+                continue
+            try:
+                row = EnrollmentRow.model_validate(record)
+            except ValidationError as e:
+                results.append(_error(number, _validation_message(e)))
+                continue
+            if row.student_id is None and not row.username:
+                results.append(_error(number, "student_id or username is required"))
+                continue
+            rows.append((number, row))
+        batch_results = await asyncio.to_thread(_insert_enrollments, rows, instructor_id)
+        for result in batch_results:
+            if result["status"] == "enrolled":
+                invalidate_user(result["student_id"])
+        results.extend(batch_results)
+    return summarize(request, results)
+
+
+def _insert_enrollments(rows: list, instructor_id: int | None) -> list[dict]:
+    results = []
+    db = SessionLocal()
+    try:
+        usernames = {row.username for _, row in rows if row.student_id is None}
+        ids_by_name = dict(db.execute(
+            select(models.User.username, models.User.id).where(models.User.username.in_(usernames))
+        ).all()) if usernames else {}
+        student_ids = {row.student_id for _, row in rows if row.student_id is not None}
+        known_ids = set(db.execute(
+            select(models.User.id).where(models.User.id.in_(student_ids))
+        ).scalars()) if student_ids else set()
+
+        classroom_query = select(models.Classroom.id).where(
+            models.Classroom.id.in_({row.classroom_id for _, row in rows})
+        )
+        if instructor_id is not None:
+            classroom_query = classroom_query.where(models.Classroom.instructor_id == instructor_id)
+        allowed_classrooms = set(db.execute(classroom_query).scalars())
+
+        resolved = []
+        for number, row in rows:
+            student_id = row.student_id if row.student_id is not None else ids_by_name.get(row.username)
+            if student_id is None or (row.student_id is not None and student_id not in known_ids):
+                results.append(_error(number, "Student not found", classroom_id=row.classroom_id))
+                continue
+            if row.classroom_id not in allowed_classrooms:
+                results.append(_error(number, f"Classroom {row.classroom_id} not found or not yours", classroom_id=row.classroom_id))
+                continue
+            resolved.append((number, row.classroom_id, student_id))
+
+        existing = set(db.execute(
+            select(models.classroom_students.c.classroom_id, models.classroom_students.c.student_id)
+            .where(models.classroom_students.c.student_id.in_({s for _, _, s in resolved}))
+        ).tuples()) if resolved else set()
+
+        new_pairs = []
+        for number, classroom_id, student_id in resolved:
+            result = {"row": number, "classroom_id": classroom_id, "student_id": student_id}
+            if (classroom_id, student_id) in existing:
+                results.append({**result, "status": "skipped", "error": "Already enrolled"})
+                continue
+            existing.add((classroom_id, student_id))
+            new_pairs.append(result)
+
+        if new_pairs:
+            try:
+                db.execute(insert(models.classroom_students), [
+                    {"classroom_id": p["classroom_id"], "student_id": p["student_id"]} for p in new_pairs
+                ])
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                results.extend({**p, "status": "error", "error": f"Batch failed: {e.__class__.__name__}"} for p in new_pairs)
+                return results
+        results.extend({**p, "status": "enrolled"} for p in new_pairs)
+        return results
+    finally:
+        db.close()
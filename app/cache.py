@@ -0,0 +1,105 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from .config import settings
+from . import models
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache where every entry also expires after
+    `ttl_seconds`. Keeps hit/miss/eviction counters so we can see if it pays off.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def invalidate_where(self, predicate) -> int:
+        """Drop every entry for which predicate(key, value) is true."""
+        with self._lock:
+            stale = [k for k, (v, _) in self._data.items() if predicate(k, v)]
+            for key in stale:
+                del self._data[key]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# -----------------------------
+# Student tutor answers
+# -----------------------------
+tutor_answer_cache = TTLCache(
+    maxsize=settings.TUTOR_CACHE_SIZE,
+    ttl_seconds=settings.TUTOR_CACHE_TTL_SECONDS,
+)
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+def tutor_answer_key(lesson_id: int, lesson_content: str | None, question: str) -> tuple:
+    content_hash = hashlib.sha256((lesson_content or "").encode("utf-8")).hexdigest()
+    return (lesson_id, content_hash, normalize_question(question))
+
+
+def invalidate_lesson_answers(lesson_id: int) -> int:
+    return tutor_answer_cache.invalidate_where(lambda key, _: key[0] == lesson_id)
+
+
+# Any write to a lesson (from any route) drops its cached answers
+@event.listens_for(models.Lesson, "after_update")
+@event.listens_for(models.Lesson, "after_delete")
+def _invalidate_on_lesson_write(mapper, connection, target):
+    invalidate_lesson_answers(target.id)
@@ -0,0 +1,103 @@
+import gzip
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .config import settings
+
+try:
+    import brotli
+except ImportError: # optional, gzip only without it
+    brotli = None
+
+
+# Already compressed, or streamed where buffering would hold back events
+SKIP_CONTENT_TYPES = ("text/event-stream", "image/", "audio/", "video/", "font/woff", "application/zip", "application/gzip")
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Pick br or gzip from an Accept-Encoding header (q=0 means "not this one")."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    Negotiated brotli/gzip for response bodies of at least COMPRESSION_MIN_SIZE
+    bytes. Only bodies sent in one piece (JSON, HTML) are compressed; streamed
+    responses such as SSE or file downloads pass through untouched, so
+    streaming still flushes chunk by chunk.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message # hold it until we've seen the body
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            if start is not None:
+                head, start = start, None
+                headers = MutableHeaders(raw=head["headers"])
+                body = message.get("body", b"")
+                if (
+                    message.get("more_body", False)
+                    or len(body) < settings.COMPRESSION_MIN_SIZE
+                    or "content-encoding" in headers
+                    or headers.get("content-type", "").startswith(SKIP_CONTENT_TYPES)
+                ):
+                    passthrough = True
+                    await send(head)
+                    await send(message)
+                    return
+
+                if len(body) >= settings.COMPRESSION_THREAD_MIN_SIZE:
+                    # Big lesson bodies: don't hold up the event loop
+                    compressed = await anyio.to_thread.run_sync(compress, body, encoding)
+                else:
+                    compressed = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(compressed))
+                headers.add_vary_header("Accept-Encoding")
+                await send(head)
+                await send({"type": "http.response.body", "body": compressed})
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
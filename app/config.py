@@ -1,8 +1,112 @@
+import os
+from dotenv import load_dotenv
+
+
+load_dotenv()
 
 class Settings:
-    
-    SECRET_KEY = "SUPER_SECRET_RANDOM_STRING_123" 
+
+    SECRET_KEY = "SUPER_SECRET_RANDOM_STRING_123"
     ALGORITHM = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-settings = Settings()
\ No newline at end of file
+    # Authenticated principal cache (get_current_user)
+    PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+    PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+    # Password hashing. Changing BCRYPT_ROUNDS rehashes users transparently on their next login
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+    BCRYPT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("BCRYPT_QUEUE_TIMEOUT_SECONDS", "5"))
+
+    # Bulk imports: temporary passwords are hashed cheaper and upgraded to
+    # BCRYPT_ROUNDS on first login (see needs_rehash)
+    BULK_BCRYPT_ROUNDS = int(os.getenv("BULK_BCRYPT_ROUNDS", "10"))
+    BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+    BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "50000"))
+
+    # Database
+    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_LP_app.db")
+    # Defaults to DATABASE_URL with its async driver (aiosqlite / asyncpg / aiomysql)
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT_SECONDS = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+    DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    # Durability vs commit cost: NORMAL (default, safe in WAL mode except on
+    # power loss), FULL (fsync every commit) or OFF
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    DB_LEAK_THRESHOLD_SECONDS = int(os.getenv("DB_LEAK_THRESHOLD_SECONDS", "60"))
+    DB_LEAK_TRACEBACKS = os.getenv("DB_LEAK_TRACEBACKS", "false").lower() == "true"
+
+    # List endpoints (keyset pagination)
+    PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "50"))
+    PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "200"))
+
+    # Session expiry: the sweeper closes active sessions idle (no heartbeat) or
+    # open for too long. 0 disables a threshold; a 0 interval disables the sweeper.
+    # Idle expiry is off by default: only turn it on once clients send
+    # POST /sessions/{id}/heartbeat, or every session looks idle from the start
+    SESSION_IDLE_TIMEOUT_MINUTES = int(os.getenv("SESSION_IDLE_TIMEOUT_MINUTES", "0"))
+    SESSION_MAX_DURATION_MINUTES = int(os.getenv("SESSION_MAX_DURATION_MINUTES", "240"))
+    SESSION_SWEEP_INTERVAL_SECONDS = int(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+    SESSION_SWEEP_BATCH_SIZE = int(os.getenv("SESSION_SWEEP_BATCH_SIZE", "500"))
+    # POST /sessions/start: "buffered" collects bursts and writes them in one
+    # transaction (after FLUSH_MS or FLUSH_ROWS, whichever comes first);
+    # "direct" commits every start on its own
+    SESSION_START_MODE = os.getenv("SESSION_START_MODE", "buffered")
+    SESSION_START_FLUSH_MS = float(os.getenv("SESSION_START_FLUSH_MS", "5"))
+    SESSION_START_FLUSH_ROWS = int(os.getenv("SESSION_START_FLUSH_ROWS", "200"))
+
+    # Live presence events (WebSockets). "memory" keeps them inside this process;
+    # "database" shares them between workers through the bus_events table
+    EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+    EVENTS_POLL_INTERVAL_SECONDS = float(os.getenv("EVENTS_POLL_INTERVAL_SECONDS", "0.5"))
+    EVENTS_RETENTION_SECONDS = int(os.getenv("EVENTS_RETENTION_SECONDS", "300"))
+    EVENTS_MAX_PENDING = int(os.getenv("EVENTS_MAX_PENDING", "200")) # per socket, before it's told to resync
+
+    # Logging: "json" (one object per line) or "text"
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+    # Prometheus metrics on GET /metrics (request latency, SQL per request, LLM calls).
+    # Admins only, or a scraper sending "Authorization: Bearer <METRICS_TOKEN>"
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+    # Conditional GET on lesson/course/classroom reads
+    HTTP_CACHE_MAX_AGE_SECONDS = int(os.getenv("HTTP_CACHE_MAX_AGE_SECONDS", "0"))
+
+    # Response compression (brotli needs the optional `brotli` package)
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    COMPRESSION_THREAD_MIN_SIZE = int(os.getenv("COMPRESSION_THREAD_MIN_SIZE", str(128 * 1024)))
+    GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+    BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+    # Templates
+    TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR") # defaults to a folder in the system temp dir
+    TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "false").lower() == "true"
+
+    # LLM provider
+    GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+    LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+
+    # Student tutor answer cache
+    TUTOR_CACHE_SIZE = int(os.getenv("TUTOR_CACHE_SIZE", "2000"))
+    TUTOR_CACHE_TTL_SECONDS = int(os.getenv("TUTOR_CACHE_TTL_SECONDS", "3600"))
+
+    # Lesson retrieval for the student tutor
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+    RETRIEVAL_CHUNK_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", "200"))
+
+    # LLM work queue
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "100"))
+    LLM_MAX_QUEUED_PER_USER = int(os.getenv("LLM_MAX_QUEUED_PER_USER", "5"))
+
+    # Background lesson generation
+    AI_JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", "4"))
+
+settings = Settings()
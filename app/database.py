@@ -1,16 +1,80 @@
-from sqlalchemy import create_engine
+import asyncio
+import logging
+import time
+import traceback
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from .config import settings
+from . import metrics
 
 
+logger = logging.getLogger(__name__)
 
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_LP_app.db"
+# Async drivers used when ASYNC_DATABASE_URL isn't set explicitly
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+
+def _engine_kwargs(url) -> dict:
+    kwargs = {
+        "pool_pre_ping": True,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+    }
+    if url.get_backend_name() == "sqlite":
+        kwargs["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # In-memory SQLite uses a single shared connection, pool sizing doesn't apply
+            return kwargs
+    kwargs.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    )
+    return kwargs
+
+
+SQLITE_SYNCHRONOUS = settings.SQLITE_SYNCHRONOUS
+if SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError(f"SQLITE_SYNCHRONOUS must be OFF, NORMAL, FULL or EXTRA, not {SQLITE_SYNCHRONOUS!r}")
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers keep going while one writer commits; busy_timeout makes
+    # writers wait for the lock instead of failing straight away with "database is locked"
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.close()
+
+
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_kwargs(_url))
+if _url.get_backend_name() == "sqlite":
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
 
 SessionLocal = sessionmaker(autocommit = False, autoflush=False, bind=engine)
 
+# Async engine for the read-heavy routes: same database, same pragmas, no threadpool
+if settings.ASYNC_DATABASE_URL:
+    _async_url = make_url(settings.ASYNC_DATABASE_URL)
+else:
+    _async_url = _url.set(drivername=ASYNC_DRIVERS.get(_url.get_backend_name(), _url.drivername))
+async_engine = create_async_engine(_async_url, **_engine_kwargs(_async_url))
+if _async_url.get_backend_name() == "sqlite":
+    event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -18,5 +82,52 @@ def get_db():
     try:
         yield db
     finally:
-        db.close
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# -----------------------------
+# Connection leak detection
+# -----------------------------
+# Every pool checkout is recorded until it is checked back in. A connection
+# held longer than DB_LEAK_THRESHOLD_SECONDS almost always means a Session
+# that was never closed; the watchdog logs it (with the checkout stack when
+# DB_LEAK_TRACEBACKS is on, which costs a bit on every checkout).
+_checked_out = {}
+
+def _track_checkout(dbapi_connection, connection_record, connection_proxy):
+    stack = "".join(traceback.format_stack(limit=15)) if settings.DB_LEAK_TRACEBACKS else None
+    _checked_out[id(connection_record)] = (time.monotonic(), stack)
+
+def _track_checkin(dbapi_connection, connection_record):
+    _checked_out.pop(id(connection_record), None)
+
+for _tracked in (engine, async_engine.sync_engine):
+    event.listen(_tracked, "checkout", _track_checkout)
+    event.listen(_tracked, "checkin", _track_checkin)
+    if settings.METRICS_ENABLED:
+        metrics.instrument_engine(_tracked) # statement counts/timings for /metrics
+
+
+def find_leaked_connections(older_than: float = None) -> list[tuple[float, str | None]]:
+    """(seconds held, checkout stack) for every connection out longer than `older_than`."""
+    older_than = settings.DB_LEAK_THRESHOLD_SECONDS if older_than is None else older_than
+    now = time.monotonic()
+    return [
+        (now - checked_out_at, stack)
+        for checked_out_at, stack in list(_checked_out.values())
+        if now - checked_out_at > older_than
+    ]
+
 
+async def watch_for_leaks():
+    while True:
+        await asyncio.sleep(settings.DB_LEAK_THRESHOLD_SECONDS)
+        for held_for, stack in find_leaked_connections():
+            logger.warning(
+                "DB connection checked out for %.0fs, likely a leaked session%s",
+                held_for, f"; checked out at:\n{stack}" if stack else ""
+            )
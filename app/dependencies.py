@@ -1,13 +1,14 @@
 import jwt
+import logging
 from datetime import datetime, timedelta, timezone
-from fastapi import Depends, HTTPException, status, Request
+from fastapi import Depends, HTTPException, status, Request, WebSocket, WebSocketException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session, joinedload
-from .models import User
-from . import database, models
-
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import database
+from .principals import Principal, principal_cache, load_principal
 
 
+logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login", auto_error=False)
 
@@ -23,71 +24,72 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
-def get_current_user(
+async def principal_from_token(token: str, db: AsyncSession) -> Principal | None:
+    try:
+        payload = jwt.decode(token, "SUPER_SECRET_KEY", algorithms=["HS256"])
+        username: str = payload.get("sub")
+    except jwt.PyJWTError as e:
+        logger.debug("JWT decode failed: %s", e)
+        return None
+    if username is None:
+        return None
+
+    # Roles and enrollments are cached per user; the routes that change them invalidate
+    principal = principal_cache.get(username)
+    if principal is None:
+        principal = await load_principal(db, username)
+        if principal is None:
+            return None
+        principal_cache.set(username, principal)
+    return principal
+
+
+async def get_current_user(
     request: Request,
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(database.get_db)
-):
-    # 1. DEFINE THIS FIRST so it doesn't crash
+    db: AsyncSession = Depends(database.get_async_db)
+) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    print(f"DEBUG: Token from Header: {token}")
-    
-    # 2. Check cookie if header is missing
+    # Check cookie if header is missing
     if not token:
         token = request.cookies.get("access_token")
-        print(f"DEBUG: Token from Cookie: {token}")
-
-    # 3. If still None, raise the error (now it will work because it's defined!)
     if not token:
-        print("DEBUG: No token found anywhere")
+        logger.debug("No token in Authorization header or cookie")
         raise credentials_exception
 
-    try:
-        payload = jwt.decode(token, "SUPER_SECRET_KEY", algorithms=["HS256"])
-        username: str = payload.get("sub")
-        print(f"DEBUG: Decoded username: {username}")
-    except Exception as e:
-        print(f"DEBUG: JWT Decode Failed: {e}")
-        raise credentials_exception
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-    )
-    if not token:
-        token = request.cookies.get("access_token")
-    if not token:
-        raise credentials_exception
-    try:
-        payload = jwt.decode(token, "SUPER_SECRET_KEY", algorithms=["HS256"])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except jwt.PyJWTError:
+    principal = await principal_from_token(token, db)
+    if principal is None:
         raise credentials_exception
+    return principal
 
-    user = (
-        db.query(models.User)
-        .options(joinedload(models.User.roles))  # 🔥 THIS LINE
-        .filter(models.User.username == username)
-        .first()
-    )
 
-    if user is None:
-        raise credentials_exception
+async def get_websocket_user(
+    websocket: WebSocket,
+    token: str | None = None,
+    db: AsyncSession = Depends(database.get_async_db)
+) -> Principal:
+    """
+    Browsers can't set an Authorization header on a WebSocket, so the token
+    comes as ?token= (or the access_token cookie).
+    """
+    token = token or websocket.cookies.get("access_token")
+    principal = await principal_from_token(token, db) if token else None
+    if principal is None:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Could not validate credentials")
+    return principal
+
 
-    return user
 def require_role(*allowed_roles: str):
-    def checker(current_user: User = Depends(get_current_user)):
-        user_roles = {role.name for role in current_user.roles}
-        if not user_roles.intersection(set(allowed_roles)):
+    async def checker(current_user: Principal = Depends(get_current_user)):
+        if not current_user.role_names.intersection(set(allowed_roles)):
             raise HTTPException(
                 status_code=403,
                 detail="Insufficient permissions"
             )
         return current_user
-    return checker
\ No newline at end of file
+    return checker
@@ -0,0 +1,266 @@
+import asyncio
+import itertools
+import json
+import logging
+import uuid
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select
+from .config import settings
+from .database import engine
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# In-process event bus
+# -----------------------------
+# Routes publish small events ("session 12 started") to topics such as
+# "classroom:3" and "lesson:7"; WebSocket handlers subscribe to the topics
+# they show. Events carry a `key` naming the thing they describe: if a socket
+# falls behind, newer events replace older ones with the same key, so a slow
+# client gets the latest state instead of a growing backlog. Past
+# EVENTS_MAX_PENDING distinct keys it is told to resync instead.
+
+
+class Subscription:
+    def __init__(self, topics, max_pending: int):
+        self.topics = frozenset(topics)
+        self.max_pending = max_pending
+        self.pending = OrderedDict() # key -> latest event
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def offer(self, event: dict):
+        key = event["key"]
+        if key in self.pending:
+            self.pending.pop(key) # coalesce: keep the newest, in arrival order
+        elif len(self.pending) >= self.max_pending:
+            self.overflowed = True
+            self.pending.clear()
+        if not self.overflowed:
+            self.pending[key] = event
+        self.ready.set()
+
+    async def next_batch(self) -> list[dict]:
+        """Wait for events, then take everything pending."""
+        await self.ready.wait()
+        self.ready.clear()
+        if self.overflowed:
+            self.overflowed = False
+            self.pending.clear()
+            return [{"type": "resync"}]
+        batch = list(self.pending.values())
+        self.pending.clear()
+        return batch
+
+
+class EventBus:
+    def __init__(self, backend):
+        self.backend = backend
+        self.backend.bus = self
+        self.subscriptions = defaultdict(set) # topic -> subscriptions
+        self.loop = None
+        self._keys = itertools.count()
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        await self.backend.start()
+
+    async def stop(self):
+        await self.backend.stop()
+        self.loop = None
+
+    def subscribe(self, *topics: str, max_pending: int = None) -> Subscription:
+        subscription = Subscription(topics, max_pending or settings.EVENTS_MAX_PENDING)
+        for topic in subscription.topics:
+            self.subscriptions[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for topic in subscription.topics:
+            self.subscriptions[topic].discard(subscription)
+            if not self.subscriptions[topic]:
+                del self.subscriptions[topic]
+
+    def publish(self, topics: list[str], event: dict):
+        """Safe to call from the sync routes' threadpool. Publish after the commit."""
+        event.setdefault("key", f"event:{next(self._keys)}")
+        self.backend.publish({"topics": list(topics), "event": event})
+
+    def deliver(self, message: dict):
+        """Hand a message to this process's subscribers, from any thread."""
+        loop = self.loop
+        if loop is None: # not started (scripts, migrations): nobody is listening
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fan_out(message)
+        else:
+            loop.call_soon_threadsafe(self._fan_out, message)
+
+    def _fan_out(self, message: dict):
+        targets = set()
+        for topic in message["topics"]:
+            targets.update(self.subscriptions.get(topic, ()))
+        for subscription in targets:
+            subscription.offer(message["event"])
+
+
+# -----------------------------
+# Backends
+# -----------------------------
+class MemoryBackend:
+    """Single process: publishing is delivering."""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, message: dict):
+        self.bus.deliver(message)
+
+
+class DatabaseBackend:
+    """
+    Stand-in broker for several workers on one database: messages are
+    delivered locally straight away and written to `bus_events`; every
+    worker polls that table for what the others published.
+    """
+
+    def __init__(self, poll_interval: float = None, retention_seconds: int = None):
+        self.origin = uuid.uuid4().hex
+        self.poll_interval = poll_interval or settings.EVENTS_POLL_INTERVAL_SECONDS
+        self.retention = timedelta(seconds=retention_seconds or settings.EVENTS_RETENTION_SECONDS)
+        self.last_id = 0
+        self.task = None
+
+    async def start(self):
+        self.last_id = await asyncio.to_thread(self._max_id)
+        self.task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def publish(self, message: dict):
+        self.bus.deliver(message)
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._write, message)
+        except RuntimeError: # no loop in this thread: we're in the threadpool already
+            self._write(message)
+
+    def _write(self, message: dict):
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(models.BusEvent).values(
+                    origin=self.origin, message=json.dumps(message, default=str), created_at=datetime.utcnow()
+                ))
+        except Exception:
+            # Only this worker's sockets get this one
+            logger.exception("Could not share event with other workers")
+
+    def _max_id(self) -> int:
+        with engine.connect() as connection:
+            return connection.execute(select(func.max(models.BusEvent.id))).scalar() or 0
+
+    def _fetch(self) -> list:
+        with engine.connect() as connection:
+            rows = connection.execute(
+                select(models.BusEvent.id, models.BusEvent.origin, models.BusEvent.message)
+                .where(models.BusEvent.id > self.last_id)
+                .order_by(models.BusEvent.id)
+            ).all()
+            return rows
+
+    def _prune(self):
+        with engine.begin() as connection:
+            connection.execute(delete(models.BusEvent).where(models.BusEvent.created_at < datetime.utcnow() - self.retention))
+
+    async def _poll(self):
+        polls = 0
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                rows = await asyncio.to_thread(self._fetch)
+                for row in rows:
+                    self.last_id = row.id
+                    if row.origin != self.origin:
+                        self.bus.deliver(json.loads(row.message))
+                polls += 1
+                if polls % 120 == 0: # every minute or so at the default interval
+                    await asyncio.to_thread(self._prune)
+            except Exception:
+                logger.exception("Polling bus_events failed")
+
+
+BACKENDS = {"memory": MemoryBackend, "database": DatabaseBackend}
+
+bus = EventBus(BACKENDS[settings.EVENTS_BACKEND]())
+
+
+# -----------------------------
+# Session presence events
+# -----------------------------
+def session_state(session) -> dict:
+    return {
+        "id": session.id,
+        "lesson_id": session.lesson_id,
+        "student_id": session.student_id,
+        "is_active": session.is_active,
+        "start_time": session.start_time.isoformat() if session.start_time else None,
+        "end_time": session.end_time.isoformat() if session.end_time else None,
+    }
+
+
+def session_messages(db, kind: str, states: list[dict]) -> list[tuple[list[str], dict]]:
+    """
+    (topics, event) for each session: its lesson and its classroom. Looks up
+    classrooms and usernames in two queries however many sessions there are.
+    Build these before committing a delete, publish them after the commit.
+    """
+    if not states:
+        return []
+    lesson_ids = {state["lesson_id"] for state in states}
+    classrooms = dict(db.execute(
+        select(models.Lesson.id, models.Course.classroom_id)
+        .join(models.Course, models.Course.id == models.Lesson.course_id)
+        .where(models.Lesson.id.in_(lesson_ids))
+    ).all())
+    student_ids = {state["student_id"] for state in states if state["student_id"] is not None}
+    usernames = dict(db.execute(
+        select(models.User.id, models.User.username).where(models.User.id.in_(student_ids))
+    ).all()) if student_ids else {}
+
+    messages = []
+    for state in states:
+        topics = [f"lesson:{state['lesson_id']}"]
+        if classrooms.get(state["lesson_id"]) is not None:
+            topics.append(f"classroom:{classrooms[state['lesson_id']]}")
+        event = {
+            "type": kind,
+            "key": f"session:{state['id']}",
+            "session": {**state, "student": usernames.get(state["student_id"])},
+        }
+        messages.append((topics, event))
+    return messages
+
+
+def publish_student_joined(classroom_id: int, student_id: int):
+    bus.publish([f"classroom:{classroom_id}"], {
+        "type": "student_joined",
+        "key": f"student:{student_id}",
+        "classroom_id": classroom_id,
+        "student_id": student_id,
+    })
+
+
+def publish_all(messages: list[tuple[list[str], dict]]):
+    for topics, event in messages:
+        bus.publish(topics, event)
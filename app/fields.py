@@ -0,0 +1,87 @@
+import typing
+from functools import lru_cache
+from fastapi import HTTPException, Query
+from pydantic import BaseModel, ConfigDict, create_model
+from .responses import FastJSONResponse
+
+
+class FieldSelector:
+    """
+    Sparse fieldsets (`?fields=id,title,courses.lessons.title`) for read
+    endpoints, used as a dependency.
+
+    Dotted names reach into nested objects and lists. The response is built
+    from a trimmed copy of the schema, so attributes that weren't asked for
+    (deferred columns, relationships) are never touched or lazy-loaded.
+    Without `fields` the route's response_model is used as usual.
+    """
+
+    def __init__(
+        self,
+        fields: str | None = Query(None, description="Comma-separated fields to return, dotted for nested ones"),
+    ):
+        self.paths = tuple(sorted({tuple(f.strip().split(".")) for f in fields.split(",") if f.strip()})) if fields else ()
+
+    def wants(self, name: str) -> bool:
+        """Whether top-level field `name` ends up in the response."""
+        return not self.paths or any(path[0] == name for path in self.paths)
+
+    def render(self, schema: type[BaseModel], obj):
+        if not self.paths:
+            return obj
+        model = _subset_model(schema, self.paths)
+        return FastJSONResponse(model.model_validate(obj).model_dump(mode="json"))
+
+
+def _nested_model(annotation):
+    """(model, is_list) for a field annotated as Model or List[Model]."""
+    if typing.get_origin(annotation) is list:
+        (item,) = typing.get_args(annotation)
+        return item, True
+    return annotation, False
+
+
+def _selection(schema: type[BaseModel], paths) -> dict:
+    """Turn dotted paths into {field: True | {sub-selection}}, checking names against the schema."""
+    selection = {}
+    for path in paths:
+        level, current = selection, schema
+        for depth, name in enumerate(path):
+            field = current.model_fields.get(name)
+            if field is None:
+                raise HTTPException(status_code=400, detail=f"Unknown field '{'.'.join(path[:depth + 1])}'")
+            if depth == len(path) - 1:
+                level[name] = True
+                break
+            current, _ = _nested_model(field.annotation)
+            if not (isinstance(current, type) and issubclass(current, BaseModel)):
+                raise HTTPException(status_code=400, detail=f"Field '{'.'.join(path[:depth + 1])}' has no sub-fields")
+            if level.get(name) is True:
+                break # the whole object is already selected
+            level = level.setdefault(name, {})
+    return selection
+
+
+def _build(schema: type[BaseModel], selection: dict) -> type[BaseModel]:
+    fields = {}
+    for name, field in schema.model_fields.items(): # keep the schema's field order
+        if name not in selection:
+            continue
+        sub = selection[name]
+        annotation = field.annotation
+        if sub is not True:
+            nested, is_list = _nested_model(annotation)
+            nested = _build(nested, sub)
+            annotation = list[nested] if is_list else nested
+        default = ... if field.is_required() else field.get_default(call_default_factory=True)
+        fields[name] = (annotation, default)
+    return create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **fields
+    )
+
+
+@lru_cache(maxsize=256)
+def _subset_model(schema: type[BaseModel], paths: tuple) -> type[BaseModel]:
+    return _build(schema, _selection(schema, paths))
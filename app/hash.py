@@ -1,13 +1,107 @@
+import asyncio
 import bcrypt
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from .config import settings
 
-def hash_password(password:str) -> str:
-    salt = bcrypt.gensalt()
+
+class HashingBusyError(Exception):
+    """No hashing worker freed up within BCRYPT_QUEUE_TIMEOUT_SECONDS."""
+
+
+def hash_password(password:str, rounds: int = None) -> str:
+    salt = bcrypt.gensalt(rounds=rounds or settings.BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     # bcrypt.checkpw automatically extracts the salt from the hash
     # and compares the two
     return bcrypt.checkpw(
-        plain_password.encode('utf-8'), 
+        plain_password.encode('utf-8'),
         hashed_password.encode('utf-8')
-    )
\ No newline at end of file
+    )
+
+def hash_rounds(hashed_password: str) -> int:
+    # bcrypt hashes look like $2b$12$<salt+hash>, the middle part is the cost
+    return int(hashed_password.split("$")[2])
+
+def needs_rehash(hashed_password: str) -> bool:
+    return hash_rounds(hashed_password) != settings.BCRYPT_ROUNDS
+
+
+# -----------------------------
+# Off-loop hashing
+# -----------------------------
+# bcrypt is pure CPU, so it runs in its own small process pool instead of the
+# threadpool that serves every sync endpoint. The semaphore bounds how many
+# requests may wait for a worker; past the timeout we answer 503 instead.
+_pool = None
+_slots = None
+_bulk_slots = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the server process has threads and an event loop running
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.BCRYPT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(settings.BCRYPT_WORKERS * 2)
+    return _slots
+
+async def _run_in_pool(func, *args):
+    slots = _get_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), settings.BCRYPT_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HashingBusyError("Password hashing is busy, please retry")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), func, *args)
+    finally:
+        slots.release()
+
+def _get_bulk_slots() -> asyncio.Semaphore:
+    global _bulk_slots
+    if _bulk_slots is None:
+        # Leave one worker free so logins keep working during an import
+        _bulk_slots = asyncio.Semaphore(max(1, settings.BCRYPT_WORKERS - 1))
+    return _bulk_slots
+
+def _hash_many(passwords: list[str], rounds: int) -> list[str]:
+    return [hash_password(password, rounds) for password in passwords]
+
+async def ahash_passwords(passwords: list[str], rounds: int = None, chunk_size: int = 8) -> list[str]:
+    """
+    Hash a whole batch in parallel, for bulk imports. Runs in small chunks on
+    the same pool, but never on every worker at once, and waits for its turn
+    instead of failing with HashingBusyError.
+    """
+    rounds = rounds or settings.BCRYPT_ROUNDS
+    slots = _get_bulk_slots()
+    loop = asyncio.get_running_loop()
+
+    async def run_chunk(chunk):
+        async with slots:
+            return await loop.run_in_executor(_get_pool(), _hash_many, chunk, rounds)
+
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    results = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+    return [hashed for chunk in results for hashed in chunk]
+
+async def ahash_password(password: str) -> str:
+    return await _run_in_pool(hash_password, password, settings.BCRYPT_ROUNDS)
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_pool(verify_password, plain_password, hashed_password)
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,67 @@
+import hashlib
+from fastapi import Request, Response
+from sqlalchemy import select
+from .config import settings
+from . import models
+
+# -----------------------------
+# Conditional GET
+# -----------------------------
+# ETags are built from version columns (bumped by the ORM on every UPDATE),
+# never from the serialized body, so a 304 can be answered before the object
+# is loaded or serialized. They are weak (W/) because the same representation
+# may be sent gzip'd or not.
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def cache_control() -> str:
+    # private: responses depend on who is asking, shared caches must not keep them
+    return f"private, max-age={settings.HTTP_CACHE_MAX_AGE_SECONDS}, must-revalidate"
+
+
+def is_fresh(request: Request, etag: str) -> bool:
+    """True if the client's If-None-Match already has this ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control()})
+
+
+def with_etag(result, response: Response, etag: str):
+    """Attach ETag/Cache-Control to the route's result (a Response or a plain object)."""
+    target = result if isinstance(result, Response) else response
+    target.headers["ETag"] = etag
+    target.headers["Cache-Control"] = cache_control()
+    return result
+
+
+# Children of a course/classroom have their own versions. These queries list
+# (id, version) pairs straight off the foreign-key indexes, so adding,
+# removing or editing any lesson changes the parent's ETag too.
+def course_children(course_id: int):
+    return (
+        select(models.Lesson.id, models.Lesson.version)
+        .where(models.Lesson.course_id == course_id)
+        .order_by(models.Lesson.id)
+    )
+
+
+def classroom_children(classroom_id: int):
+    return (
+        select(models.Course.id, models.Course.version, models.Lesson.id, models.Lesson.version)
+        .outerjoin(models.Lesson, models.Lesson.course_id == models.Course.id)
+        .where(models.Course.classroom_id == classroom_id)
+        .order_by(models.Course.id, models.Lesson.id)
+    )
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from .agent import aget_tutor_response
+from .config import settings
+from .database import SessionLocal
+from .scheduler import QueueFullError, llm_scheduler
+from . import models
+
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = {"succeeded", "failed"}
+
+
+class JobRunner:
+    """
+    Runs AI lesson generation off the request path.
+
+    Jobs are rows in `generation_jobs`; the runner only keeps their ids in an
+    asyncio queue that a fixed pool of worker tasks drains. LLM calls still go
+    through the shared llm_scheduler, so jobs and interactive requests share
+    the same concurrency limit.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._finished = {} # job_id -> asyncio.Event, only for jobs someone is waiting on
+
+    async def start(self):
+        # Anything left queued/running by a previous process gets picked up again
+        for job_id in await asyncio.to_thread(self._unfinished_job_ids):
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job_id: str):
+        self._queue.put_nowait(job_id)
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    async def wait(self, job_id: str, timeout: float) -> bool:
+        """Wait until the job finishes. Returns False on timeout."""
+        finished = self._finished.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(finished.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            done = True
+            try:
+                done = await self._run(job_id)
+            except Exception:
+                logger.exception("Generation job %s crashed", job_id)
+            finally:
+                self._queue.task_done()
+                if done:
+                    finished = self._finished.pop(job_id, None)
+                    if finished is not None:
+                        finished.set()
+
+    async def _run(self, job_id: str) -> bool:
+        """Returns False if the job was put back in the queue for later."""
+        job = await asyncio.to_thread(self._mark_running, job_id)
+        if job is None:
+            return True
+        user_id, prompt, role = job
+        try:
+            async with llm_scheduler.slot(f"user:{user_id}"):
+                content = await aget_tutor_response(prompt, role)
+        except QueueFullError as e:
+            # The LLM is busy, not broken: try again once the scheduler expects room
+            await asyncio.to_thread(self._mark_queued, job_id)
+            logger.info("Generation job %s deferred %ds: %s", job_id, e.retry_after, e.detail)
+            asyncio.get_running_loop().call_later(e.retry_after, self._queue.put_nowait, job_id)
+            return False
+        except Exception as e:
+            await asyncio.to_thread(self._mark_failed, job_id, str(e))
+            return True
+        await asyncio.to_thread(self._mark_succeeded, job_id, content)
+        return True
+
+    # -----------------------------
+    # DB helpers (run in a thread)
+    # -----------------------------
+    @staticmethod
+    def _unfinished_job_ids() -> list[str]:
+        db = SessionLocal()
+        try:
+            rows = db.query(models.GenerationJob.id).filter(
+                models.GenerationJob.status.in_(["queued", "running"])
+            ).order_by(models.GenerationJob.created_at).all()
+            return [row.id for row in rows]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _mark_running(job_id: str):
+        db = SessionLocal()
+        try:
+            job = db.get(models.GenerationJob, job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return None
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            db.commit()
+            return job.user_id, job.prompt, job.role
+        finally:
+            db.close()
+
+    @staticmethod
+    def _mark_queued(job_id: str):
+        db = SessionLocal()
+        try:
+            job = db.get(models.GenerationJob, job_id)
+            job.status = "queued"
+            job.started_at = None
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _mark_failed(job_id: str, error: str):
+        db = SessionLocal()
+        try:
+            job = db.get(models.GenerationJob, job_id)
+            job.status = "failed"
+            job.error = error
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _mark_succeeded(job_id: str, content: str):
+        db = SessionLocal()
+        try:
+            job = db.get(models.GenerationJob, job_id)
+            job.result = content
+            if job.save_as_lesson and job.course_id is not None:
+                lesson = models.Lesson(
+                    title=job.lesson_title or "AI Generated Lesson",
+                    content=content,
+                    course_id=job.course_id
+                )
+                db.add(lesson)
+                db.flush()
+                job.lesson_id = lesson.id
+            job.status = "succeeded"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            JobRunner._mark_failed(job_id, f"Generated, but saving failed: {e}")
+        finally:
+            db.close()
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+job_runner = JobRunner(workers=settings.AI_JOB_WORKERS)
@@ -1,31 +1,37 @@
-from fastapi import FastAPI, Request
+import asyncio
+from fastapi import Depends, FastAPI, Request
+from sqlalchemy.orm.exc import StaleDataError
 from . import models
-from .database import SessionLocal, engine
-from .routes import users, roles, classrooms, lessons, sessions, ai, pages, courses
+from .database import SessionLocal, engine, watch_for_leaks
+from .routes import users, roles, classrooms, lessons, sessions, ai, pages, courses, bulk, analytics, presence, search, metrics
 from .seed import seed_roles
+from .migrations import run_migrations
+from .scheduler import QueueFullError
+from .jobs import job_runner
+from .sweeper import sweep_sessions
+from .events import bus
+from .writebuffer import session_starts
+from .config import settings
+from .hash import HashingBusyError, shutdown_pool
+from .compression import CompressionMiddleware
+from .metrics import MetricsMiddleware, track_in_progress
+from .logs import configure_logging
+from .responses import FastJSONResponse
 from app import models
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-import os
+from .assets import FingerprintedStaticFiles, manifest
+from .templating import precompile_templates
 
-models.Base.metadata.create_all(bind=engine)
+configure_logging()
 
 app = FastAPI(
     title="Learning Platform API",
     version="1.0.0",
-    description="Role-based learning platform with students and instructors"
+    description="Role-based learning platform with students and instructors",
+    dependencies=[Depends(track_in_progress)] if settings.METRICS_ENABLED else [],
 )
-# 1. Get the directory where THIS file (main.py) lives
-current_file_path = os.path.dirname(os.path.realpath(__file__))
-
-# 2. Join it with 'static' to get the full folder path
-static_abs_path = os.path.join(current_file_path, "static")
-
-# 3. Mount it so /static/logo.png works
-app.mount("/static", StaticFiles(directory=static_abs_path), name="static")
-templates = Jinja2Templates(directory="app/templates")
+# /static/logo.png still works; templates link the fingerprinted /static/logo.<hash>.png via static_url()
+app.mount("/static", FingerprintedStaticFiles(manifest), name="static")
 
 
 origins = [
@@ -34,6 +40,9 @@ origins = [
     "http://your-frontend-url.com", # Replace with your actual HTML page URL and port
 ]
 
+# Added before CORS so it wraps the app inside it: CORS headers get set on the compressed response
+app.add_middleware(CompressionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -42,14 +51,67 @@ app.add_middleware(
     allow_headers=["*"],     # Allows all headers
 )
 
+# Added last so it wraps everything else: latency includes compression
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(QueueFullError)
+async def llm_queue_full(request: Request, exc: QueueFullError):
+    # Fail fast with a hint instead of holding the connection while the LLM queue drains
+    return FastJSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(HashingBusyError)
+async def hashing_busy(request: Request, exc: HashingBusyError):
+    return FastJSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(StaleDataError)
+async def stale_update(request: Request, exc: StaleDataError):
+    # Someone else saved this row first (its version column moved on): not a server error
+    if "if-match" in request.headers:
+        return FastJSONResponse(status_code=412, content={"detail": "The resource has changed since it was fetched"})
+    return FastJSONResponse(status_code=409, content={"detail": "The resource was changed by someone else, reload and retry"})
+
 
 @app.on_event("startup")
 def startup():
+    run_migrations(engine)
     db = SessionLocal()
     try:
         seed_roles(db)
     finally:
         db.close()
+    precompile_templates()
+
+
+background_tasks = []
+
+
+@app.on_event("startup")
+async def start_background_workers():
+    await job_runner.start()
+    await bus.start()
+    if settings.SESSION_START_MODE == "buffered":
+        session_starts.start()
+    background_tasks.append(asyncio.create_task(watch_for_leaks()))
+    if settings.SESSION_SWEEP_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(sweep_sessions()))
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    for task in background_tasks:
+        task.cancel()
+    await session_starts.stop()
+    await job_runner.stop()
+    await bus.stop()
+    shutdown_pool()
 
 app.include_router(pages.router, tags=["Pages"])
 app.include_router(users.router, prefix="/users", tags=["Users"])
@@ -59,3 +121,9 @@ app.include_router(sessions.router, prefix="/sessions", tags=["Sessions"])
 app.include_router(lessons.router, prefix="/lessons", tags=["Lessons"])
 app.include_router(ai.router, prefix="/ai", tags=["AI"])
 app.include_router(courses.router, prefix="/courses", tags=["courses"])
+app.include_router(bulk.router, prefix="/bulk", tags=["Bulk"])
+app.include_router(analytics.router, prefix="/analytics", tags=["Analytics"])
+app.include_router(presence.router, prefix="/ws", tags=["Presence"])
+app.include_router(search.router, prefix="/search", tags=["Search"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
@@ -0,0 +1,277 @@
+import bisect
+import contextvars
+import threading
+import time
+from sqlalchemy import event
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# -----------------------------
+# Prometheus metrics
+# -----------------------------
+# Counters, gauges and histograms kept in process and rendered in the
+# Prometheus text format on GET /metrics. Small enough that it isn't worth a
+# dependency; with several workers, scrape each one (or label by instance).
+#
+# Requests are labelled by endpoint name ("get_lesson"), never by raw path,
+# so the number of series stays bounded.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {} # label values tuple -> value
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value) # first bucket with value <= le
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0] # per bucket, sum, count
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            items = sorted((key, (list(counts), total, n)) for key, (counts, total, n) in self.values.items())
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for le, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le_label = f'le="{_format_number(float(le))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le_label)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {n}")
+        return lines
+
+
+REGISTRY = []
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# -----------------------------
+# The metrics themselves
+# -----------------------------
+http_requests = Counter(
+    "http_requests_total", "HTTP requests by endpoint and status code.", ("method", "handler", "status")
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time to send the full response, by endpoint.", ("method", "handler")
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "Requests currently being handled, by endpoint.", ("method", "handler")
+)
+db_statements = Counter(
+    "db_statements_total", "SQL statements executed, by kind (select, insert, ...).", ("operation",)
+)
+db_statement_duration = Histogram(
+    "db_statement_duration_seconds", "Time spent in each SQL statement.", ("operation",)
+)
+db_statements_per_request = Histogram(
+    "db_statements_per_request", "SQL statements executed while handling one request.", ("method", "handler"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+db_time_per_request = Histogram(
+    "db_time_per_request_seconds", "Total time in SQL statements while handling one request.", ("method", "handler")
+)
+llm_requests = Counter(
+    "llm_requests_total", "LLM calls by prompt and outcome.", ("prompt", "model", "status")
+)
+llm_request_duration = Histogram(
+    "llm_request_duration_seconds", "LLM call latency, to the last token for streamed answers.", ("prompt", "model"),
+    buckets=LLM_BUCKETS,
+)
+llm_tokens = Counter(
+    "llm_tokens_total", "Tokens reported by the LLM provider, by direction (input/output).", ("prompt", "model", "direction")
+)
+
+
+# -----------------------------
+# SQL statements (SQLAlchemy engine events)
+# -----------------------------
+class RequestQueries:
+    """SQL statements run on behalf of one request (shared with its threadpool work)."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Set by MetricsMiddleware. Starlette copies the context into the threadpool,
+# so sync routes and the async engine both add to the same object.
+current_queries: contextvars.ContextVar[RequestQueries | None] = contextvars.ContextVar("current_queries", default=None)
+
+OPERATIONS = {"select", "insert", "update", "delete", "with", "begin", "commit", "rollback", "savepoint", "release", "pragma"}
+
+
+def _operation(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    return word if word in OPERATIONS else "other"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    operation = _operation(statement)
+    db_statements.inc(operation=operation)
+    db_statement_duration.observe(elapsed, operation=operation)
+    queries = current_queries.get()
+    if queries is not None:
+        queries.count += 1
+        queries.seconds += elapsed
+
+
+def _handle_error(exception_context):
+    # The failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("metrics_started"):
+        connection.info["metrics_started"].pop()
+
+
+def instrument_engine(engine):
+    """Count and time every statement on a (sync) engine: pass async_engine.sync_engine for the async one."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# -----------------------------
+# HTTP requests
+# -----------------------------
+def handler_of(scope: Scope) -> str:
+    """Name of the endpoint that handled (or is handling) this request, set once routing is done."""
+    route = scope.get("route")
+    return getattr(route, "name", None) or "unmatched"
+
+
+async def track_in_progress(connection: HTTPConnection):
+    """
+    App-wide dependency for the in-flight gauge. The middleware runs before
+    routing and can't tell which endpoint a request is for; this can.
+    """
+    if connection.scope["type"] != "http":
+        yield
+        return
+    labels = {"method": connection.scope["method"], "handler": handler_of(connection.scope)}
+    http_requests_in_progress.inc(**labels)
+    try:
+        yield
+    finally:
+        http_requests_in_progress.dec(**labels)
+
+
+class MetricsMiddleware:
+    """
+    Per-endpoint request count and latency, plus how many SQL statements each
+    request ran and how long they took. Latency is measured to the last
+    byte, so streamed responses count their whole stream.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500 # if the app raises before starting a response
+        queries = RequestQueries()
+        token = current_queries.set(queries)
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_queries.reset(token)
+            labels = {"method": scope["method"], "handler": handler_of(scope)}
+            http_requests.inc(status=str(status), **labels)
+            http_request_duration.observe(elapsed, **labels)
+            db_statements_per_request.observe(queries.count, **labels)
+            db_time_per_request.observe(queries.seconds, **labels)
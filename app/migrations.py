@@ -0,0 +1,162 @@
+import logging
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, func, text, update
+from sqlalchemy.engine import Connection, Engine
+from .database import Base
+from . import analytics, models, search
+
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Versioned schema migrations
+# -----------------------------
+# Replaces create_all() at import time. Each migration runs once, in its own
+# transaction, and records its version in `schema_version`. Migrations must be
+# idempotent (checkfirst / IF NOT EXISTS): a fresh database gets the whole
+# current schema from migration 1, so later migrations find their work done.
+_meta = MetaData()
+schema_version = Table(
+    "schema_version",
+    _meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def add_column_if_missing(connection: Connection, table_name: str, column: Column):
+    """ALTER TABLE ... ADD COLUMN, skipped when the column already exists."""
+    existing = {c["name"] for c in inspect(connection).get_columns(table_name)}
+    if column.name in existing:
+        return
+    column_type = column.type.compile(dialect=connection.dialect)
+    ddl = f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    connection.execute(text(ddl))
+
+
+def create_indexes(connection: Connection, table: Table):
+    # The model is always the latest one: indexes on columns a later
+    # migration adds are left for that migration to create
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    for index in table.indexes:
+        if all(column.name in existing for column in index.columns):
+            index.create(connection, checkfirst=True)
+
+
+def _dedupe_link_table(connection: Connection, table: Table):
+    """
+    Old databases created the link tables without a primary key, so the same
+    pair can appear more than once (and NULL halves are possible). Keep one
+    copy of each complete pair, then enforce uniqueness with an index.
+    """
+    columns = [c for c in table.columns]
+    total = connection.execute(select(func.count()).select_from(table)).scalar()
+    pairs = connection.execute(
+        select(*columns).where(*[c.isnot(None) for c in columns]).distinct()
+    ).all()
+    if len(pairs) != total:
+        logger.info("Removing %d duplicate rows from %s", total - len(pairs), table.name)
+        connection.execute(table.delete())
+        if pairs:
+            connection.execute(table.insert(), [dict(row._mapping) for row in pairs])
+
+    # Fresh databases already have the composite primary key from the model
+    if not inspect(connection).get_pk_constraint(table.name)["constrained_columns"]:
+        names = ", ".join(c.name for c in columns)
+        connection.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table.name} ON {table.name} ({names})"
+        ))
+    create_indexes(connection, table)
+
+
+def _baseline(connection: Connection):
+    Base.metadata.create_all(bind=connection)
+
+
+def _lookup_indexes(connection: Connection):
+    for model in (models.Session, models.Lesson, models.Course, models.Classroom, models.JoinRequest):
+        create_indexes(connection, model.__table__)
+    _dedupe_link_table(connection, models.classroom_students)
+    _dedupe_link_table(connection, models.user_roles)
+
+
+def _content_versions(connection: Connection):
+    for table in ("classrooms", "courses", "lessons"):
+        add_column_if_missing(connection, table, Column("version", Integer, nullable=False, server_default="1"))
+
+
+def _session_rollups(connection: Connection):
+    add_column_if_missing(connection, "sessions", Column("student_id", Integer))
+    create_indexes(connection, models.Session.__table__)
+    for model in analytics.ROLLUPS:
+        model.__table__.create(connection, checkfirst=True)
+    counted = analytics.rebuild(connection)
+    logger.info("Rolled up %d existing sessions", counted)
+
+
+def _session_expiry(connection: Connection):
+    add_column_if_missing(connection, "sessions", Column("last_seen_at", DateTime))
+    add_column_if_missing(connection, "sessions", Column("end_time", DateTime))
+    for name in ("ended", "duration_seconds"):
+        add_column_if_missing(connection, "lesson_stats", Column(name, Integer, nullable=False, server_default="0"))
+    connection.execute(
+        update(models.Session.__table__)
+        .where(models.Session.last_seen_at.is_(None))
+        .values(last_seen_at=models.Session.start_time)
+    )
+    create_indexes(connection, models.Session.__table__)
+    # A plain index on a boolean is mostly useless, and SQLite would pick it
+    # over the partial ones above
+    connection.execute(text("DROP INDEX IF EXISTS ix_sessions_is_active"))
+    counted = analytics.rebuild(connection)
+    logger.info("Rolled up %d existing sessions", counted)
+
+
+def _event_bus(connection: Connection):
+    models.BusEvent.__table__.create(connection, checkfirst=True)
+
+
+def _search_index(connection: Connection):
+    if not search.create_index(connection):
+        logger.info("No FTS5 here, /search will use LIKE")
+
+
+# (version, description, function) — append only, never renumber
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "indexes on foreign-key/status lookups, unique link tables", _lookup_indexes),
+    (3, "version columns on classrooms/courses/lessons", _content_versions),
+    (4, "sessions.student_id and session analytics rollups", _session_rollups),
+    (5, "sessions.last_seen_at/end_time, partial indexes on active sessions", _session_expiry),
+    (6, "bus_events table for the shared event backend", _event_bus),
+    (7, "FTS5 search index over lessons and courses (SQLite)", _search_index),
+]
+
+
+def current_version(connection: Connection) -> int:
+    return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def run_migrations(engine: Engine) -> int:
+    """Bring the database up to the latest version. Returns the version reached."""
+    with engine.begin() as connection:
+        _meta.create_all(bind=connection)
+        version = current_version(connection)
+
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as connection:
+            # Another worker may have got here first
+            if current_version(connection) >= number:
+                continue
+            logger.info("Applying migration %d: %s", number, description)
+            migrate(connection)
+            connection.execute(schema_version.insert().values(
+                version=number, description=description, applied_at=datetime.utcnow()
+            ))
+        version = number
+    return version
@@ -1,18 +1,18 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, Boolean, Date, DateTime, Index, func
 from .database import Base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred, column_property
 from datetime import datetime
 
 user_roles = Table(
     'user_roles',
     Base.metadata,
-    Column('user_id', Integer, ForeignKey('users.id')),
-    Column('role_id', Integer, ForeignKey('roles.id')))
+    Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
+    Column('role_id', Integer, ForeignKey('roles.id'), primary_key=True))
 classroom_students = Table(
     "classroom_students",
     Base.metadata,
-    Column("classroom_id", Integer, ForeignKey("classrooms.id")),
-    Column("student_id", Integer, ForeignKey("users.id")),
+    Column("classroom_id", Integer, ForeignKey("classrooms.id"), primary_key=True),
+    Column("student_id", Integer, ForeignKey("users.id"), primary_key=True, index=True),
 )
 
 
@@ -42,33 +42,103 @@ class Classroom(Base):
     __tablename__ = "classrooms"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
-    instructor_id = Column(Integer, ForeignKey("users.id"))
+    instructor_id = Column(Integer, ForeignKey("users.id"), index=True)
     instructor = relationship("User", back_populates="classrooms")
     students = relationship("User", secondary="classroom_students", back_populates="enrolled_classrooms")
     courses = relationship("Course", back_populates="classroom", cascade="all, delete-orphan")
+    version = Column(Integer, nullable=False, server_default="1") # bumped on every UPDATE, feeds the ETag
+
+    __mapper_args__ = {"version_id_col": version}
 
 class Lesson(Base):
     __tablename__ = "lessons"
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
-    content = Column(String)
-    course_id = Column(Integer, ForeignKey("courses.id")) # Link to Course
+    content = deferred(Column(String)) # AI lessons get big, only loaded when asked for (undefer)
+    course_id = Column(Integer, ForeignKey("courses.id"), index=True) # Link to Course
     
     course = relationship("Course", back_populates="lessons")
     sessions = relationship("Session", back_populates="lesson", cascade="all, delete-orphan")
+    version = Column(Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
+
+# Computed in SQL so listings can say "has content" without pulling the body
+Lesson.has_content = column_property(func.coalesce(func.length(Lesson.content), 0) > 0)
+
+
+class LessonChunk(Base):
+    __tablename__ = "lesson_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), index=True)
+    position = Column(Integer, nullable=False)
+    text = Column(String, nullable=False)
+    term_counts = Column(String, nullable=False) # JSON {term: count}, used for BM25
+    length = Column(Integer, nullable=False)
 
 
 class Session(Base):
     __tablename__ = "sessions"
 
     id = Column(Integer, primary_key=True, index=True)
-    lesson_id = Column(Integer, ForeignKey("lessons.id"))
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), index=True)
     start_time = Column(DateTime, default=datetime.utcnow)
-    is_active = Column(Boolean, default=True)
+    is_active = Column(Boolean, default=True) # indexed through the partial indexes below
+    student_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True) # None for instructor-created sessions
+    last_seen_at = Column(DateTime, nullable=True) # start_time, then every heartbeat
+    end_time = Column(DateTime, nullable=True) # set when the session is closed
 
     lesson = relationship("Lesson", back_populates="sessions")
 
+    # The sweeper only ever looks at active sessions: partial indexes (SQLite,
+    # PostgreSQL) stay as small as the active set instead of the whole history
+    __table_args__ = (
+        Index("ix_sessions_active_last_seen", "last_seen_at", sqlite_where=is_active == True, postgresql_where=is_active == True),
+        Index("ix_sessions_active_start", "start_time", sqlite_where=is_active == True, postgresql_where=is_active == True),
+    )
+
+
+# -----------------------------
+# Session analytics rollups
+# -----------------------------
+# Kept up to date by app/analytics.py in the same transaction as the session
+# write, so dashboards read a few rows per bucket instead of scanning
+# `sessions`. classroom_id is copied in so classroom totals are one GROUP BY.
+class LessonStats(Base):
+    __tablename__ = "lesson_stats"
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), primary_key=True)
+    classroom_id = Column(Integer, nullable=False, index=True)
+    sessions = Column(Integer, nullable=False, default=0)
+    active = Column(Integer, nullable=False, default=0)
+    ended = Column(Integer, nullable=False, default=0, server_default="0") # sessions with an end_time
+    duration_seconds = Column(Integer, nullable=False, default=0, server_default="0") # summed over `ended`
+
+class LessonDailyStats(Base):
+    __tablename__ = "lesson_daily_stats"
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), primary_key=True)
+    day = Column(Date, primary_key=True) # UTC
+    classroom_id = Column(Integer, nullable=False)
+    sessions = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_lesson_daily_stats_classroom_day", "classroom_id", "day"),)
+
+class LessonHourlyStats(Base):
+    __tablename__ = "lesson_hourly_stats"
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), primary_key=True)
+    hour = Column(Integer, primary_key=True) # 0-23, UTC
+    classroom_id = Column(Integer, nullable=False, index=True)
+    sessions = Column(Integer, nullable=False, default=0)
+
+class LessonStudentStats(Base):
+    __tablename__ = "lesson_student_stats"
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), primary_key=True)
+    student_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    classroom_id = Column(Integer, nullable=False, index=True)
+    sessions = Column(Integer, nullable=False, default=0) # rows at 0 are former students
+
+
 class JoinRequest(Base):
     __tablename__ = "join_requests"
     id = Column(Integer, primary_key=True, index=True)
@@ -77,11 +147,47 @@ class JoinRequest(Base):
     status = Column(String, default="pending")
     student = relationship("User", foreign_keys=[student_id])
 
+    __table_args__ = (
+        Index("ix_join_requests_instructor_status", "instructor_id", "status"),
+        Index("ix_join_requests_student_instructor_status", "student_id", "instructor_id", "status"),
+    )
+
 class Course(Base):
     __tablename__ = "courses"
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
-    classroom_id = Column(Integer, ForeignKey("classrooms.id"))
+    classroom_id = Column(Integer, ForeignKey("classrooms.id"), index=True)
     
     classroom = relationship("Classroom", back_populates="courses")
-    lessons = relationship("Lesson", back_populates="course", cascade="all, delete-orphan")
\ No newline at end of file
+    lessons = relationship("Lesson", back_populates="course", cascade="all, delete-orphan")
+    version = Column(Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
+
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    id = Column(String, primary_key=True, index=True) # uuid4 hex, handed to the client
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    course_id = Column(Integer, ForeignKey("courses.id"), nullable=True)
+    prompt = Column(String, nullable=False)
+    role = Column(String, default="instructor")
+    status = Column(String, default="queued", index=True) # queued / running / succeeded / failed
+    save_as_lesson = Column(Boolean, default=False)
+    lesson_title = Column(String, nullable=True)
+    result = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class BusEvent(Base):
+    # Shared mailbox for EVENTS_BACKEND=database: each worker polls for the
+    # rows other workers published (see app/events.py). Pruned after EVENTS_RETENTION_SECONDS.
+    __tablename__ = "bus_events"
+    id = Column(Integer, primary_key=True)
+    origin = Column(String, nullable=False) # publishing worker, which already delivered it locally
+    message = Column(String, nullable=False) # JSON {"topics": [...], "event": {...}}
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
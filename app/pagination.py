@@ -0,0 +1,51 @@
+import base64
+import json
+from fastapi import HTTPException, Query, Request, Response
+from .config import settings
+
+
+class PageParams:
+    """
+    Keyset pagination for list endpoints, used as a dependency.
+
+    Rows are always ordered by primary key and the cursor is just the last id
+    of the previous page, so every page is an indexed range scan no matter how
+    deep the client pages. The next cursor is returned in the X-Next-Cursor
+    header (plus a Link: rel="next"), which keeps the JSON body a plain list.
+    """
+
+    def __init__(
+        self,
+        limit: int | None = Query(None, ge=1, description=f"Page size, at most {settings.PAGE_MAX_LIMIT}"),
+        cursor: str | None = Query(None, description="X-Next-Cursor value from the previous page"),
+    ):
+        self.limit = min(limit or settings.PAGE_DEFAULT_LIMIT, settings.PAGE_MAX_LIMIT)
+        self.after_id = decode_cursor(cursor) if cursor else None
+
+    def apply(self, query, id_column):
+        """Works for both Query objects and select() statements."""
+        if self.after_id is not None:
+            query = query.where(id_column > self.after_id)
+        # One extra row tells us whether there is a next page
+        return query.order_by(id_column).limit(self.limit + 1)
+
+    def finish(self, rows: list, request: Request, response: Response) -> list:
+        rows = list(rows)
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            next_cursor = encode_cursor(rows[-1].id)
+            response.headers["X-Next-Cursor"] = next_cursor
+            response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+        return rows
+
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
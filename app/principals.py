@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from .cache import TTLCache
+from .config import settings
+from . import models
+
+
+@dataclass(frozen=True)
+class PrincipalRole:
+    id: int
+    name: str
+    description: str | None = None
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    Detached snapshot of the logged-in user: what routes need to authorize a
+    request, without holding on to a Session or lazy-loading relationships.
+    """
+    id: int
+    username: str
+    email: str
+    roles: tuple[PrincipalRole, ...]
+    enrolled_classroom_ids: frozenset[int]
+
+    @property
+    def role_names(self) -> set[str]:
+        return {role.name for role in self.roles}
+
+
+# Keyed by token subject (username)
+principal_cache = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
+
+async def load_principal(db: AsyncSession, username: str) -> Principal | None:
+    user = (await db.execute(
+        select(models.User)
+        .options(selectinload(models.User.roles))
+        .where(models.User.username == username)
+    )).scalars().first()
+    if user is None:
+        return None
+
+    enrolled = (await db.execute(
+        select(models.classroom_students.c.classroom_id)
+        .where(models.classroom_students.c.student_id == user.id)
+    )).scalars().all()
+
+    return Principal(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        roles=tuple(PrincipalRole(id=r.id, name=r.name, description=r.description) for r in user.roles),
+        enrolled_classroom_ids=frozenset(enrolled),
+    )
+
+
+def invalidate_user(user_id: int):
+    """Call after changing a user's roles, enrollments, or deleting them."""
+    principal_cache.invalidate_where(lambda _, principal: principal.id == user_id)
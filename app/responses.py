@@ -0,0 +1,33 @@
+import json
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError: # optional, falls back to the stdlib encoder
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson when it's installed.
+
+    Not the app-wide default on purpose: with the default class FastAPI
+    dumps response_model routes straight to bytes through pydantic-core,
+    which is as fast as orjson for our list/tree payloads, and setting any
+    default_response_class turns that path off. orjson wins big on long
+    strings though (a lesson body encodes ~10x faster), so it is used for
+    lesson reads and for hand-built responses.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps(content: Any) -> bytes:
+    """JSON bytes for hand-written payloads (NDJSON lines, SSE frames)."""
+    if orjson is None:
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
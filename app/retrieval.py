@@ -0,0 +1,168 @@
+import json
+import math
+import re
+from collections import Counter
+from fastapi import BackgroundTasks
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import settings
+from .database import SessionLocal
+from . import models
+
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does",
+    "for", "from", "how", "i", "if", "in", "is", "it", "its", "of", "on", "or",
+    "so", "that", "the", "their", "there", "this", "to", "was", "what", "when",
+    "where", "which", "who", "why", "will", "with", "you", "your",
+}
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n|\n(?=#)")
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def chunk_text(content: str, max_words: int = None) -> list[str]:
+    """
+    Split lesson markdown into chunks of roughly `max_words` words.
+    Paragraphs/headings are kept together where possible.
+    """
+    max_words = max_words or settings.RETRIEVAL_CHUNK_WORDS
+    chunks, current, current_words = [], [], 0
+
+    for paragraph in _PARAGRAPH_RE.split(content or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        words = paragraph.split()
+
+        # A single huge paragraph gets cut into word windows
+        if len(words) > max_words:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_words = [], 0
+            for i in range(0, len(words), max_words):
+                chunks.append(" ".join(words[i:i + max_words]))
+            continue
+
+        if current_words + len(words) > max_words and current:
+            chunks.append("\n\n".join(current))
+            current, current_words = [], 0
+        current.append(paragraph)
+        current_words += len(words)
+
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def chunk_rows(lesson_id: int, content: str | None) -> list[dict]:
+    rows = []
+    for position, text in enumerate(chunk_text(content or "")):
+        terms = tokenize(text)
+        rows.append({
+            "lesson_id": lesson_id,
+            "position": position,
+            "text": text,
+            "term_counts": json.dumps(Counter(terms)),
+            "length": len(terms),
+        })
+    return rows
+
+
+def index_lesson(connection, lesson_id: int, content: str | None):
+    """(Re)build the chunk index of one lesson. Works on a raw connection so it can run inside flush events."""
+    table = models.LessonChunk.__table__
+    connection.execute(table.delete().where(table.c.lesson_id == lesson_id))
+    rows = chunk_rows(lesson_id, content)
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+def index_unindexed_lesson(lesson_id: int):
+    """Background task: build the index of a lesson that has none yet, in its own session."""
+    db = SessionLocal()
+    try:
+        if db.scalar(select(models.LessonChunk.id).where(models.LessonChunk.lesson_id == lesson_id).limit(1)):
+            return # another request got there first
+        content = db.scalar(select(models.Lesson.content).where(models.Lesson.id == lesson_id))
+        index_lesson(db.connection(), lesson_id, content)
+        db.commit()
+    finally:
+        db.close()
+
+
+def rank_chunks(chunks: list, question: str, top_k: int) -> list:
+    """Score chunks against the question with BM25 and return the best `top_k`, in lesson order."""
+    query_terms = set(tokenize(question))
+    if not query_terms:
+        return chunks[:top_k]
+
+    term_counts = [json.loads(chunk.term_counts) for chunk in chunks]
+    n = len(chunks)
+    avg_length = (sum(chunk.length for chunk in chunks) / n) or 1
+    doc_freq = {t: sum(1 for counts in term_counts if t in counts) for t in query_terms}
+
+    scored = []
+    for chunk, counts in zip(chunks, term_counts):
+        score = 0.0
+        for term in query_terms:
+            tf = counts.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * chunk.length / avg_length))
+        scored.append((score, chunk))
+
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    best = [chunk for _, chunk in scored[:top_k]]
+    return sorted(best, key=lambda chunk: chunk.position)
+
+
+async def lesson_context(
+    db: AsyncSession, lesson_id: int, content: str | None, question: str,
+    background_tasks: BackgroundTasks, top_k: int = None
+) -> str:
+    """
+    The part of a lesson worth sending to the LLM for this question.
+    Short lessons are sent whole; long ones only as their top-k BM25 chunks.
+    """
+    top_k = top_k or settings.RETRIEVAL_TOP_K
+    chunks = (await db.scalars(
+        select(models.LessonChunk)
+        .where(models.LessonChunk.lesson_id == lesson_id)
+        .order_by(models.LessonChunk.position)
+    )).all()
+    if not chunks and content:
+        # Lessons written before the index existed, or imported with core
+        # inserts (no ORM events): rank chunks cut in memory this time and
+        # write the index after the response, never from this read path
+        chunks = [models.LessonChunk(**row) for row in chunk_rows(lesson_id, content)]
+        background_tasks.add_task(index_unindexed_lesson, lesson_id)
+
+    if len(chunks) <= top_k:
+        return content
+
+    return "\n\n...\n\n".join(chunk.text for chunk in rank_chunks(chunks, question, top_k))
+
+
+@event.listens_for(models.Lesson, "after_insert")
+def _index_new_lesson(mapper, connection, target):
+    index_lesson(connection, target.id, target.content)
+
+@event.listens_for(models.Lesson, "after_update")
+def _reindex_lesson(mapper, connection, target):
+    if inspect(target).attrs.content.history.has_changes():
+        index_lesson(connection, target.id, target.content)
+
+@event.listens_for(models.Lesson, "before_delete")
+def _drop_lesson_index(mapper, connection, target):
+    table = models.LessonChunk.__table__
+    connection.execute(table.delete().where(table.c.lesson_id == target.id))
@@ -1,9 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.dependencies import require_role # Ensure get_db is imported
-from app.agent import get_tutor_response, get_student_tutor_response
-from app import models, schemas, database
+from app.dependencies import require_role, get_current_user # Ensure get_db is imported
+from app.agent import (
+    aget_tutor_response, aget_student_tutor_response,
+    astream_tutor_response, astream_student_tutor_response
+)
+from app.streaming import sse_response, sse_event
+from app.cache import tutor_answer_cache, tutor_answer_key
+from app.retrieval import lesson_context
+from app.scheduler import llm_scheduler
+from app.jobs import job_runner, new_job_id, FINISHED_STATUSES
+from app import models, schemas, database, access
 # 1. Define the missing AIRequest model
 class AIRequest(BaseModel):
     topic: str
@@ -16,15 +28,17 @@ router = APIRouter()
 async def generate_ai_lesson(
     course_id: int,
     request: AIRequest,  # Now 'AIRequest' is defined above!
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     user = Depends(require_role("instructor"))
 ):
-    course = db.query(models.Course).filter(models.Course.id == course_id).first()
+    course = await db.scalar(select(models.Course.id).where(models.Course.id == course_id))
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
+    await db.close() # nothing else to read while the LLM writes
     role_name = user.roles[0].name 
     instruction = f"Create a full, structured educational lesson about {request.topic}."
-    ai_content = get_tutor_response(instruction, role_name)
+    async with llm_scheduler.slot(f"user:{user.id}"):
+        ai_content = await aget_tutor_response(instruction, role_name)
     # try:
     #     new_lesson = models.Lesson(
     #         title=f"AI Generated: {request.topic}",
@@ -47,24 +61,219 @@ async def generate_ai_lesson(
         "content": ai_content
     }
 
+@router.post("/generate-lesson/{course_id}/stream")
+async def stream_ai_lesson(
+    course_id: int,
+    request: AIRequest,
+    http_request: Request,
+    db: AsyncSession = Depends(database.get_async_db),
+    user = Depends(require_role("instructor"))
+):
+    """
+    Same as /generate-lesson/{course_id}, but streams the lesson as
+    Server-Sent Events while Gemini is still writing it.
+    """
+    course = await db.scalar(select(models.Course.id).where(models.Course.id == course_id))
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    await db.close()
+    role_name = user.roles[0].name
+    instruction = f"Create a full, structured educational lesson about {request.topic}."
+    user_key = f"user:{user.id}"
+    llm_scheduler.check(user_key)
+    return sse_response(http_request, llm_scheduler.stream(user_key, astream_tutor_response(instruction, role_name)))
+
+def _client_key(http_request: Request) -> str:
+    # /ask-tutor is not behind login, so fair queuing goes by client address
+    return f"ip:{http_request.client.host if http_request.client else 'unknown'}"
+
 @router.post("/ask-tutor")
-def ask_tutor(
+async def ask_tutor(
     request: schemas.AIQuestionRequest, # You'll need to define this in schemas
-    db: Session = Depends(database.get_db)
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     # 1. Fetch the lesson from the database
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == request.lesson_id).first()
+    lesson = (await db.execute(
+        select(models.Lesson.id, models.Lesson.title, models.Lesson.content).where(models.Lesson.id == request.lesson_id)
+    )).first()
     
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found.")
 
-    # 2. Get the answer from your new student agent
-    try:
-        answer = get_student_tutor_response(
+    # 2. Reuse the answer if this question was already asked about this lesson
+    cache_key = tutor_answer_key(lesson.id, lesson.content, request.question)
+    answer = tutor_answer_cache.get(cache_key)
+    if answer is not None:
+        return {"answer": answer}
+
+    # 3. Get the answer from your new student agent
+    context = await lesson_context(db, lesson.id, lesson.content, request.question, background_tasks)
+    await db.close() # don't hold a connection while the LLM answers
+    async with llm_scheduler.slot(_client_key(http_request)):
+        try:
+            answer = await aget_student_tutor_response(
+                student_question=request.question,
+                lesson_title=lesson.title,
+                lesson_content=context
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    tutor_answer_cache.set(cache_key, answer)
+    return {"answer": answer}
+
+@router.post("/ask-tutor/stream")
+async def ask_tutor_stream(
+    request: schemas.AIQuestionRequest,
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Streaming version of /ask-tutor: the answer is sent as Server-Sent Events
+    so the lesson page can show the first tokens right away.
+    """
+    lesson = (await db.execute(
+        select(models.Lesson.id, models.Lesson.title, models.Lesson.content).where(models.Lesson.id == request.lesson_id)
+    )).first()
+
+    if not lesson:
+        raise HTTPException(status_code=404, detail="Lesson not found.")
+
+    cache_key = tutor_answer_key(lesson.id, lesson.content, request.question)
+    cached = tutor_answer_cache.get(cache_key)
+    if cached is not None:
+        async def cached_chunks():
+            yield cached
+        return sse_response(http_request, cached_chunks())
+
+    lesson_title = lesson.title
+    context = await lesson_context(db, lesson.id, lesson.content, request.question, background_tasks)
+    await db.close()
+    client_key = _client_key(http_request)
+    llm_scheduler.check(client_key)
+
+    async def answer_chunks():
+        parts = []
+        async for chunk in llm_scheduler.stream(client_key, astream_student_tutor_response(
             student_question=request.question,
-            lesson_title=lesson.title,
-            lesson_content=lesson.content
+            lesson_title=lesson_title,
+            lesson_content=context
+        )):
+            parts.append(chunk)
+            yield chunk
+        # Only complete answers are cached, never ones cut short by a disconnect
+        tutor_answer_cache.set(cache_key, "".join(parts))
+
+    return sse_response(http_request, answer_chunks())
+
+@router.get("/cache-stats")
+def tutor_cache_stats(admin = Depends(require_role("admin"))):
+    """
+    Hit/miss counters for the student tutor answer cache.
+    """
+    return tutor_answer_cache.stats()
+
+@router.get("/queue-stats")
+def llm_queue_stats(admin = Depends(require_role("admin"))):
+    """
+    Queue depth, concurrency and wait-time numbers for the LLM work queue.
+    """
+    return llm_scheduler.stats()
+
+
+# -----------------------------
+# Background generation jobs
+# -----------------------------
+@router.post("/jobs", response_model=schemas.GenerationJob, status_code=202)
+async def submit_generation_job(
+    data: schemas.GenerationJobCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    user = Depends(require_role("instructor"))
+):
+    """
+    Queue a lesson generation and return right away with the job id.
+    With save_as_lesson the result is also stored as a new lesson in course_id.
+    """
+    if data.course_id is not None:
+        await access.aauthorize(
+            db, models.Course, data.course_id,
+            access.owns_course(user.id, data.course_id),
+            forbidden="You do not have permission to add lessons to this course"
         )
-        return {"answer": answer}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+    elif data.save_as_lesson:
+        raise HTTPException(status_code=400, detail="course_id is required to save the result as a lesson")
+
+    job = models.GenerationJob(
+        id=new_job_id(),
+        user_id=user.id,
+        course_id=data.course_id,
+        prompt=data.prompt,
+        role=user.roles[0].name if user.roles else "instructor",
+        save_as_lesson=data.save_as_lesson,
+        lesson_title=data.title
+    )
+    db.add(job)
+    await db.commit() # expire_on_commit is off, job keeps its values
+
+    job_runner.submit(job.id)
+    return job
+
+def _own_job(job: models.GenerationJob | None, user) -> models.GenerationJob:
+    if not job or job.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def _get_own_job(db: Session, job_id: str, user) -> models.GenerationJob:
+    return _own_job(db.get(models.GenerationJob, job_id), user)
+
+@router.get("/jobs/{job_id}", response_model=schemas.GenerationJob)
+def get_generation_job(
+    job_id: str,
+    db: Session = Depends(database.get_db),
+    user = Depends(get_current_user)
+):
+    """
+    Poll a generation job.
+    """
+    return _get_own_job(db, job_id, user)
+
+@router.get("/jobs/{job_id}/events")
+async def generation_job_events(
+    job_id: str,
+    http_request: Request,
+    db: AsyncSession = Depends(database.get_async_db),
+    user = Depends(get_current_user)
+):
+    """
+    Subscribe to a generation job as Server-Sent Events: one `status` event now
+    and a `done` event with the finished job, with keep-alives in between.
+    """
+    job = _own_job(await db.get(models.GenerationJob, job_id), user)
+    snapshot = schemas.GenerationJob.model_validate(job).model_dump(mode="json")
+    await db.close() # the stream reloads the job in its own sessions
+
+    def load_job():
+        db_job = database.SessionLocal()
+        try:
+            return schemas.GenerationJob.model_validate(db_job.get(models.GenerationJob, job_id)).model_dump(mode="json")
+        finally:
+            db_job.close()
+
+    async def event_stream():
+        yield sse_event(snapshot, event="status")
+        current = snapshot
+        while current["status"] not in FINISHED_STATUSES:
+            if await http_request.is_disconnected():
+                return
+            if not await job_runner.wait(job_id, timeout=15):
+                yield ": keep-alive\n\n"
+            current = await asyncio.to_thread(load_job)
+        yield sse_event(current, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .. import models, schemas, database, access, analytics
+from ..dependencies import require_role
+from ..principals import Principal
+
+router = APIRouter()
+
+
+async def _report(db: AsyncSession, scope: str, scope_id: int, days: int) -> dict:
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    results = {}
+    for name, query in analytics.report_queries(scope, scope_id, since).items():
+        results[name] = (await db.execute(query)).all()
+    return analytics.build_report(results, since)
+
+
+@router.get("/lessons/{lesson_id}", response_model=schemas.SessionAnalytics, response_model_exclude_none=True)
+async def lesson_analytics(
+    lesson_id: int,
+    days: int = Query(30, ge=1, le=366),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(require_role("instructor", "admin"))
+):
+    """
+    Sessions started (total and per day for the last `days` days), active
+    now, distinct students and a 24-bucket time-of-day histogram (UTC).
+    """
+    rule = None if "admin" in current_user.role_names else access.owns_lesson(current_user.id, lesson_id)
+    await access.aauthorize(db, models.Lesson, lesson_id, rule, forbidden="You are not the instructor for this lesson", entity=models.Lesson.id)
+    return await _report(db, "lesson_id", lesson_id, days)
+
+
+@router.get("/classrooms/{classroom_id}", response_model=schemas.SessionAnalytics)
+async def classroom_analytics(
+    classroom_id: int,
+    days: int = Query(30, ge=1, le=366),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(require_role("instructor", "admin"))
+):
+    """Same as the lesson report, summed over the classroom, plus a per-lesson breakdown."""
+    rule = None if "admin" in current_user.role_names else access.owns_classroom(current_user.id, classroom_id)
+    await access.aauthorize(db, models.Classroom, classroom_id, rule, forbidden="You do not own this classroom", entity=models.Classroom.id)
+    return await _report(db, "classroom_id", classroom_id, days)
+
+
+@router.post("/rebuild")
+def rebuild_analytics(
+    db: Session = Depends(database.get_db),
+    admin: Principal = Depends(require_role("admin"))
+):
+    """Recompute every rollup from the sessions table."""
+    counted = analytics.rebuild(db)
+    db.commit()
+    return {"sessions": counted}
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, Request
+from .. import bulk
+from ..dependencies import require_role
+from ..principals import Principal
+
+router = APIRouter()
+
+# Both endpoints take the file as the raw request body:
+#   curl -X POST /bulk/users -H "Content-Type: text/csv" --data-binary @students.csv
+# CSV needs a header row; any other content type is read as NDJSON. Rows past
+# BULK_MAX_ROWS are ignored and the report says "truncated": true.
+
+@router.post("/users")
+async def bulk_import_users(
+    request: Request,
+    admin: Principal = Depends(require_role("admin"))
+):
+    """
+    Columns: username, email, password (or hashed_password), role (default
+    student), classroom_id (optional, enrolls the new user). Returns a
+    result per row: created, skipped (already registered) or error.
+    """
+    return await bulk.import_users(request)
+
+@router.post("/enrollments")
+async def bulk_enroll(
+    request: Request,
+    user: Principal = Depends(require_role("instructor", "admin"))
+):
+    """
+    Columns: classroom_id plus student_id or username. Instructors can only
+    enroll into their own classrooms. Returns a result per row: enrolled,
+    skipped (already enrolled) or error.
+    """
+    instructor_id = None if "admin" in user.role_names else user.id
+    return await bulk.import_enrollments(request, instructor_id)
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
-from .. import models, schemas, database
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from .. import models, schemas, database, access
 from ..dependencies import require_role, get_current_user
-from typing import List
+from ..principals import Principal, invalidate_user
+from ..fields import FieldSelector
+from .. import http_cache, transfer, events
+from typing import List, Literal
 
 
 
@@ -11,7 +16,7 @@ router = APIRouter()
 @router.post("/", response_model=schemas.Classroom)
 def create_classroom(classroom_data: schemas.ClassroomCreate,
                      db: Session = Depends(database.get_db),
-                     instructor: models.User = Depends(require_role("instructor"))):
+                     instructor: Principal = Depends(require_role("instructor"))):
     """
     Only instructors can create classrooms.
     """
@@ -29,11 +34,14 @@ def create_classroom(classroom_data: schemas.ClassroomCreate,
 def join_classroom(
     classroom_id: int,
     db: Session = Depends(database.get_db),
-    student: models.User = Depends(require_role("student"))
+    student: Principal = Depends(require_role("student"))
 ):
-    classroom = db.query(models.Classroom).get(classroom_id)
-    classroom.students.append(student)
-    db.commit()
+    access.authorize(db, models.Classroom, classroom_id, None)
+    if not access.allowed(db, access.enrolled_in_classroom(student.id, classroom_id)):
+        db.execute(access.enrollments.insert().values(classroom_id=classroom_id, student_id=student.id))
+        db.commit()
+        invalidate_user(student.id)
+        events.publish_student_joined(classroom_id, student.id)
     return {"message": "Joined classroom"}
 
 @router.post("/{classroom_id}/assign-student/{student_id}")
@@ -41,13 +49,13 @@ def assign_student_to_classroom(
     classroom_id: int,
     student_id: int,
     db: Session = Depends(database.get_db),
-    instructor: models.User = Depends(require_role("instructor"))
+    instructor: Principal = Depends(require_role("instructor"))
 ):
     """
     Assign a student to a classroom. Instructor can only assign students to classrooms they own.
     """
-    classroom = db.query(models.Classroom).filter(models.Classroom.id == classroom_id).first()
-    student = db.query(models.User).filter(models.User.id == student_id).first()
+    classroom = db.get(models.Classroom, classroom_id)
+    student = db.get(models.User, student_id)
 
     if not classroom or not student:
         raise HTTPException(status_code=404, detail="Classroom or student not found")
@@ -55,48 +63,81 @@ def assign_student_to_classroom(
     if classroom.instructor_id != instructor.id:
         raise HTTPException(status_code=403, detail="You are not the instructor of this classroom")
 
-    if student not in classroom.students:
-        classroom.students.append(student)
+    # Checked with one indexed lookup instead of loading the whole roster
+    if not access.allowed(db, access.enrolled_in_classroom(student.id, classroom_id)):
+        db.execute(access.enrollments.insert().values(classroom_id=classroom_id, student_id=student.id))
         db.commit()
+        invalidate_user(student.id)
 
     return {"message": f"Student {student.username} assigned to classroom {classroom.name}"}
 
-@router.get("/", response_model=List[schemas.Classroom])
-def get_classrooms(
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+def _classroom_tree():
+    # Async sessions can't lazy-load, so the courses -> lessons tree is loaded up front.
+    # Lesson.content is deferred, so this only pulls ids and titles.
+    return selectinload(models.Classroom.courses).selectinload(models.Course.lessons)
+
+@router.get("/", response_model=List[schemas.ClassroomSummary])
+async def get_classrooms(
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
+    query = select(models.Classroom).options(_classroom_tree())
     if any(role.name == "instructor" for role in current_user.roles):
-        return db.query(models.Classroom).filter(
-            models.Classroom.instructor_id == current_user.id
-        ).all()
+        query = query.where(models.Classroom.instructor_id == current_user.id)
     else:
-        return current_user.enrolled_classrooms
+        query = query.where(models.Classroom.id.in_(current_user.enrolled_classroom_ids))
+    return (await db.execute(query)).scalars().all()
     
-@router.get("/enrolled", response_model=List[schemas.Classroom])
+@router.get("/enrolled", response_model=List[schemas.ClassroomSummary])
 def get_enrolled_classrooms(
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     # This returns classrooms where the student is in the 'students' list
-    return current_user.enrolled_classrooms
+    return db.query(models.Classroom).options(_classroom_tree()).filter(
+        models.Classroom.id.in_(current_user.enrolled_classroom_ids)
+    ).all()
     
-@router.get("/{classroom_id}", response_model=schemas.Classroom)
-def get_classroom_detail(
+@router.get("/{classroom_id}", response_model=schemas.ClassroomSummary)
+async def get_classroom_detail(
     classroom_id: int, 
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user) # Changed from require_role
+    request: Request,
+    response: Response,
+    fields: FieldSelector = Depends(),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_user) # Changed from require_role
 ):
-    classroom = db.query(models.Classroom).options(joinedload(models.Classroom.courses).joinedload(models.Course.lessons)
-    ).filter(models.Classroom.id == classroom_id).first()
-    if not classroom:
-        raise HTTPException(status_code=404, detail="classroom not found")
-    is_instructor = classroom.instructor_id == current_user.id
-    is_enrolled = current_user in classroom.students
-    # Fetch the classroom AND verify the instructor owns it
-    
+    # Verify the user owns the classroom or is enrolled, and get its version, in one query
+    version = await access.aauthorize(
+        db, models.Classroom, classroom_id,
+        access.can_view_classroom(current_user.id, classroom_id),
+        forbidden="you do not have access to this classroom!",
+        entity=models.Classroom.version
+    )
+    children = (await db.execute(http_cache.classroom_children(classroom_id))).all()
+    etag = http_cache.make_etag("classroom", classroom_id, version, [tuple(row) for row in children], fields.paths)
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag)
 
-    if not (is_instructor or is_enrolled):
-        raise HTTPException(status_code=403, detail="you do not have access to this classroom!")
+    classroom = (await db.execute(
+        select(models.Classroom)
+        .options(*([_classroom_tree()] if fields.wants("courses") else []))
+        .where(models.Classroom.id == classroom_id)
+    )).scalars().one()
+    return http_cache.with_etag(fields.render(schemas.ClassroomSummary, classroom), response, etag)
 
-    return classroom
+
+@router.get("/{classroom_id}/export")
+def export_classroom(
+    classroom_id: int,
+    compress: Literal["gzip"] | None = None,
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(require_role("instructor", "admin"))
+):
+    """
+    Every course in the classroom with its lessons, as streamed NDJSON
+    (?compress=gzip for a .ndjson.gz archive). Students are not included.
+    """
+    rule = None if "admin" in current_user.role_names else access.owns_classroom(current_user.id, classroom_id)
+    access.authorize(db, models.Classroom, classroom_id, rule, forbidden="You can only export your own classrooms", entity=models.Classroom.id)
+    return transfer.export_response(transfer.export_lines(classroom_id=classroom_id), f"classroom-{classroom_id}", compress)
@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from .. import models, schemas, database
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from .. import models, schemas, database, access
 from ..dependencies import get_current_user, require_role
+from ..principals import Principal
+from ..fields import FieldSelector
+from .. import http_cache, transfer
 
 router = APIRouter()
 
@@ -9,15 +14,10 @@ router = APIRouter()
 def create_new_course(
     course: schemas.CourseCreate, 
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(require_role("instructor")) #
+    current_user: Principal = Depends(require_role("instructor")) #
 ):
     # Verify the instructor owns this classroom
-    classroom = db.query(models.Classroom).filter(
-        models.Classroom.id == course.classroom_id,
-        models.Classroom.instructor_id == current_user.id
-    ).first()
-    
-    if not classroom:
+    if not access.allowed(db, access.owns_classroom(current_user.id, course.classroom_id)):
         raise HTTPException(status_code=403, detail="You do not have permission to modify this classroom.")
     
     new_course = models.Course(title=course.title, classroom_id=course.classroom_id)
@@ -26,9 +26,59 @@ def create_new_course(
     db.refresh(new_course)
     return new_course
 
-@router.get("/{course_id}", response_model=schemas.Course)
-def get_course_details(course_id: int, db: Session = Depends(database.get_db)):
-    course = db.query(models.Course).filter(models.Course.id == course_id).first()
-    if not course:
-        raise HTTPException(status_code=404, detail="Course not found")
-    return course
\ No newline at end of file
+@router.get("/{course_id}", response_model=schemas.CourseSummary)
+def get_course_details(
+    course_id: int,
+    request: Request,
+    response: Response,
+    fields: FieldSelector = Depends(),
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    # Admins see every course, everyone else needs to own or be enrolled in its classroom
+    rule = None if "admin" in current_user.role_names else access.can_view_course(current_user.id, course_id)
+    version = access.authorize(
+        db, models.Course, course_id, rule,
+        forbidden="You do not have access to this course",
+        entity=models.Course.version
+    )
+    children = db.execute(http_cache.course_children(course_id)).all()
+    etag = http_cache.make_etag("course", course_id, version, [tuple(row) for row in children], fields.paths)
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag)
+
+    course = db.query(models.Course).options(
+        *([selectinload(models.Course.lessons)] if fields.wants("lessons") else [])
+    ).filter(models.Course.id == course_id).one()
+    return http_cache.with_etag(fields.render(schemas.CourseSummary, course), response, etag)
+
+@router.get("/{course_id}/export")
+def export_course(
+    course_id: int,
+    compress: Literal["gzip"] | None = None,
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(require_role("instructor", "admin"))
+):
+    """
+    The course and its lessons as NDJSON, streamed (?compress=gzip for a
+    .ndjson.gz archive). Feed the file to POST /courses/import.
+    """
+    rule = None if "admin" in current_user.role_names else access.owns_course(current_user.id, course_id)
+    access.authorize(db, models.Course, course_id, rule, forbidden="You can only export your own courses", entity=models.Course.id)
+    return transfer.export_response(transfer.export_lines(course_id=course_id), f"course-{course_id}", compress)
+
+@router.post("/import")
+async def import_courses(
+    classroom_id: int,
+    request: Request,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(require_role("instructor", "admin"))
+):
+    """
+    Copy courses from an export (NDJSON, or gzip with Content-Encoding: gzip)
+    into one of your classrooms. All or nothing: a bad line rejects the file.
+    """
+    rule = None if "admin" in current_user.role_names else access.owns_classroom(current_user.id, classroom_id)
+    await access.aauthorize(db, models.Classroom, classroom_id, rule, forbidden="You can only import into your own classrooms", entity=models.Classroom.id)
+    await db.close() # don't sit on a connection while the upload streams in
+    return await transfer.import_courses(request, classroom_id)
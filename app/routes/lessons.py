@@ -1,7 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from .. import models, schemas, database
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, undefer
+from .. import models, schemas, database, access
+from ..fields import FieldSelector
+from ..responses import FastJSONResponse
+from .. import http_cache
 from ..dependencies import require_role, get_current_user
+from ..principals import Principal
+from ..streaming import sse_response
+from ..scheduler import llm_scheduler
 from typing import List
 
 router = APIRouter()
@@ -10,36 +18,51 @@ router = APIRouter()
 @router.post("/generate-content-only", response_model=schemas.ContentGenerationResponse)
 async def generate_ai_content(
     data: schemas.ContentGenerationRequest,
-    instructor: models.User = Depends(require_role("instructor"))
+    instructor: Principal = Depends(require_role("instructor"))
 ):
-    try:
-        # Safer way to get the role name
-        role_name = instructor.roles[0].name if instructor.roles else "instructor"
-        
-        # This assumes your agent is imported correctly
-        from app.agent import get_tutor_response 
-        ai_draft = get_tutor_response(data.prompt, role_name)
-        
-        return {"content": ai_draft}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Agent Error: {str(e)}")
+    async with llm_scheduler.slot(f"user:{instructor.id}"):
+        try:
+            # Safer way to get the role name
+            role_name = instructor.roles[0].name if instructor.roles else "instructor"
+
+            # This assumes your agent is imported correctly
+            from app.agent import aget_tutor_response
+            ai_draft = await aget_tutor_response(data.prompt, role_name)
+
+            return {"content": ai_draft}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Agent Error: {str(e)}")
+
+@router.post("/generate-content-only/stream")
+async def stream_ai_content(
+    data: schemas.ContentGenerationRequest,
+    request: Request,
+    instructor: Principal = Depends(require_role("instructor"))
+):
+    """
+    Streams the AI draft as Server-Sent Events instead of waiting for the
+    whole completion.
+    """
+    role_name = instructor.roles[0].name if instructor.roles else "instructor"
+
+    from app.agent import astream_tutor_response
+    user_key = f"user:{instructor.id}"
+    llm_scheduler.check(user_key)
+    return sse_response(request, llm_scheduler.stream(user_key, astream_tutor_response(data.prompt, role_name)))
 
 # 2. FIXED LESSON CREATION (The source of your AttributeError)
 @router.post("/", response_model=schemas.Lesson)
 def create_lesson(
     lesson_data: schemas.LessonCreate,
     db: Session = Depends(database.get_db),
-    instructor: models.User = Depends(require_role("instructor"))
+    instructor: Principal = Depends(require_role("instructor"))
 ):
-    # Fetch the COURSE that this lesson belongs to
-    course = db.query(models.Course).filter(models.Course.id == lesson_data.course_id).first()
-    
-    if not course:
-        raise HTTPException(status_code=404, detail="Course not found")
-
     # Security Check: Does this instructor own the classroom that owns this course?
-    if course.classroom.instructor_id != instructor.id:
-        raise HTTPException(status_code=403, detail="You do not have permission to add lessons to this course")
+    access.authorize(
+        db, models.Course, lesson_data.course_id,
+        access.owns_course(instructor.id, lesson_data.course_id),
+        forbidden="You do not have permission to add lessons to this course"
+    )
 
     # Save the lesson using course_id
     new_lesson = models.Lesson(
@@ -55,32 +78,41 @@ def create_lesson(
     return new_lesson
 
 # 3. FIXED PERMISSIONS FOR VIEWING
-@router.get("/{lesson_id}", response_model=schemas.Lesson)
-def read_lesson(lesson_id: int, 
-                db: Session = Depends(database.get_db),
-                current_user: models.User = Depends(get_current_user)):
+@router.get("/{lesson_id}", response_model=schemas.Lesson, response_class=FastJSONResponse)
+async def read_lesson(lesson_id: int, 
+                request: Request,
+                response: Response,
+                fields: FieldSelector = Depends(),
+                db: AsyncSession = Depends(database.get_async_db),
+                current_user: Principal = Depends(get_current_user)):
+    """
+    The only endpoint that returns the lesson body (unless ?fields leaves it out).
+    Supports If-None-Match: an unchanged lesson is answered with 304 after
+    one small query, without loading or serializing the body.
+    """
     
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
-    if not lesson:
-        raise HTTPException(status_code=404, detail="Lesson not found")
-
     # Check roles
     user_roles = [r.name.lower() for r in current_user.roles]
 
-    # Admins or the Instructor who owns the classroom
+    # Admins see everything, instructors only lessons in classrooms they own,
+    # students only lessons in classrooms they are enrolled in
     if "admin" in user_roles:
-        return lesson
-        
-    if "instructor" in user_roles:
-        if lesson.course.classroom.instructor_id == current_user.id:
-            return lesson
-        raise HTTPException(status_code=403, detail="Not your lesson")
+        rule, forbidden = None, None
+    elif "instructor" in user_roles:
+        rule, forbidden = access.owns_lesson(current_user.id, lesson_id), "Not your lesson"
+    elif "student" in user_roles:
+        rule, forbidden = access.enrolled_in_lesson(current_user.id, lesson_id), "Not enrolled in this classroom"
+    else:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
 
-    # Students must be enrolled in the classroom that owns the course
-    if "student" in user_roles:
-        classroom = lesson.course.classroom
-        if classroom in current_user.enrolled_classrooms:
-            return lesson
-        raise HTTPException(status_code=403, detail="Not enrolled in this classroom")
+    version = await access.aauthorize(db, models.Lesson, lesson_id, rule, forbidden, entity=models.Lesson.version)
+    etag = http_cache.make_etag("lesson", lesson_id, version, fields.paths)
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag)
 
-    raise HTTPException(status_code=403, detail="Insufficient permissions")
\ No newline at end of file
+    options = [undefer(models.Lesson.content)] if fields.wants("content") else []
+    lesson = (await db.execute(
+        select(models.Lesson).options(*options).where(models.Lesson.id == lesson_id)
+    )).scalars().one()
+    etag = http_cache.make_etag("lesson", lesson_id, lesson.version, fields.paths)
+    return http_cache.with_etag(fields.render(schemas.Lesson, lesson), response, etag)
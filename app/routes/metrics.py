@@ -0,0 +1,28 @@
+import hmac
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import database, metrics
+from ..config import settings
+from ..dependencies import get_current_user, oauth2_scheme
+
+router = APIRouter()
+
+
+async def metrics_reader(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """A scraper presenting METRICS_TOKEN, or a logged-in admin."""
+    if settings.METRICS_TOKEN and token and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        return
+    user = await get_current_user(request, token, db)
+    if "admin" not in user.role_names:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+
+
+@router.get("", include_in_schema=False, dependencies=[Depends(metrics_reader)])
+async def prometheus_metrics():
+    """Scrape target for Prometheus (text exposition format)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,18 +1,16 @@
 from fastapi import APIRouter, Request, Depends
-from fastapi.templating import Jinja2Templates
 from ..dependencies import get_current_user
+from ..templating import templates
 
 router = APIRouter()
 
-templates = Jinja2Templates(directory="app/templates")
-
 @router.get("/login")
 def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return templates.TemplateResponse(request, "login.html")
 
 @router.get("/register")
 def register_page(request: Request):
-    return templates.TemplateResponse("register.html", {"request": request})
+    return templates.TemplateResponse(request, "register.html")
 
 @router.get("/dashboard")
 def dashboard(
@@ -20,20 +18,18 @@ def dashboard(
     user = Depends(get_current_user)
 ):
     return templates.TemplateResponse(
+        request,
         "dashboard.html",
-        {
-            "request": request,
-            "user": user
-        }
+        {"user": user}
     )
 
 @router.get("/lessons-page")
 def lessons_page(request: Request):
-    return templates.TemplateResponse("lessons.html", {"request": request})
+    return templates.TemplateResponse(request, "lessons.html")
 
 @router.get("/classrooms-page")
 def classrooms_page(request: Request):
-    return templates.TemplateResponse("classrooms.html", {"request": request})
+    return templates.TemplateResponse(request, "classrooms.html")
 
 @router.get("/ai-lesson-architect")
 def create_course_page(
@@ -41,21 +37,22 @@ def create_course_page(
     user = Depends(get_current_user) # Ensures only logged-in users can see the page
 ):
     return templates.TemplateResponse(
+        request,
         "ai-lesson-architect.html", 
-        {"request": request, "user": user}
+        {"user": user}
     )
 
 @router.get("/create-classroom-page")
 def create_classroom_page(request: Request):
-    return templates.TemplateResponse("create-classroom.html", {"request": request})
+    return templates.TemplateResponse(request, "create-classroom.html")
 
 @router.get("/my-classrooms-page")
 def my_classrooms_page(request: Request):
-    return templates.TemplateResponse("my-classrooms.html", {"request": request})
+    return templates.TemplateResponse(request, "my-classrooms.html")
 
 @router.get("/classroom-detail-page")
 def classroom_detail_page(request: Request):
-    return templates.TemplateResponse("classroom-detail.html", {"request": request})
+    return templates.TemplateResponse(request, "classroom-detail.html")
 
 @router.get("/requests-page")
 def requests_page(
@@ -63,18 +60,19 @@ def requests_page(
     user = Depends(get_current_user) # Security: User must be logged in
 ):
     return templates.TemplateResponse(
+        request,
         "requests.html", 
-        {"request": request, "user": user}
+        {"user": user}
     )
 
 @router.get("/my-enrolled-classrooms")
 def my_enrolled_classrooms_page(request: Request):
-    return templates.TemplateResponse("student-classrooms.html", {"request": request})
+    return templates.TemplateResponse(request, "student-classrooms.html")
 
 @router.get("/lesson-view")
 def lesson_view_page(request: Request):
-    return templates.TemplateResponse("lesson-view.html", {"request": request})
+    return templates.TemplateResponse(request, "lesson-view.html")
 
 @router.get("/courses-page")
 def courses_page(request: Request):
-    return templates.TemplateResponse("courses.html", {"request": request})
\ No newline at end of file
+    return templates.TemplateResponse(request, "courses.html")
\ No newline at end of file
@@ -0,0 +1,102 @@
+import asyncio
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, WebSocketException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, database, access, events
+from ..dependencies import get_websocket_user
+from ..principals import Principal
+from ..responses import dumps
+
+router = APIRouter()
+
+# Live "who is in this lesson" for instructors, instead of polling
+# /sessions/lesson/{id}. Connect with ?token=<access token>. The first
+# message is a snapshot of the active sessions, then one message per event
+# (session_started / session_updated / session_ended / session_deleted /
+# student_joined). {"type": "resync"} means events were dropped: reconnect
+# or refetch.
+
+
+async def _check(db: AsyncSession, user: Principal, model, object_id: int, rule):
+    if "admin" in user.role_names:
+        rule = access.object_exists(model, object_id)
+    if not await access.aallowed(db, rule):
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Not allowed")
+
+
+async def _active_sessions(db: AsyncSession, criteria) -> list[dict]:
+    rows = (await db.execute(
+        select(models.Session, models.User.username)
+        .join(models.Lesson, models.Lesson.id == models.Session.lesson_id)
+        .outerjoin(models.User, models.User.id == models.Session.student_id)
+        .where(models.Session.is_active == True, criteria)
+        .order_by(models.Session.id)
+    )).all()
+    return [{**events.session_state(session), "student": username} for session, username in rows]
+
+
+async def _stream(websocket: WebSocket, subscription: events.Subscription, snapshot: list[dict]):
+    await websocket.accept()
+    await websocket.send_text(dumps({"type": "snapshot", "sessions": snapshot}).decode())
+
+    async def forward():
+        while True:
+            # Whatever piled up while we were sending arrives here already coalesced
+            for event in await subscription.next_batch():
+                await websocket.send_text(dumps(event).decode())
+
+    async def drain():
+        # We don't expect messages, but reading is how a close gets noticed
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    tasks = [asyncio.create_task(forward()), asyncio.create_task(drain())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        events.bus.unsubscribe(subscription)
+
+
+@router.websocket("/classrooms/{classroom_id}")
+async def classroom_presence(
+    websocket: WebSocket,
+    classroom_id: int,
+    db: AsyncSession = Depends(database.get_async_db),
+    user: Principal = Depends(get_websocket_user)
+):
+    await _check(db, user, models.Classroom, classroom_id, access.owns_classroom(user.id, classroom_id))
+    # Subscribe before reading the snapshot so nothing falls in between
+    subscription = events.bus.subscribe(f"classroom:{classroom_id}")
+    try:
+        snapshot = await _active_sessions(
+            db,
+            models.Lesson.course_id.in_(select(models.Course.id).where(models.Course.classroom_id == classroom_id))
+        )
+        await db.close() # don't hold a connection for the life of the socket
+    except BaseException:
+        events.bus.unsubscribe(subscription)
+        raise
+    await _stream(websocket, subscription, snapshot)
+
+
+@router.websocket("/lessons/{lesson_id}")
+async def lesson_presence(
+    websocket: WebSocket,
+    lesson_id: int,
+    db: AsyncSession = Depends(database.get_async_db),
+    user: Principal = Depends(get_websocket_user)
+):
+    await _check(db, user, models.Lesson, lesson_id, access.owns_lesson(user.id, lesson_id))
+    subscription = events.bus.subscribe(f"lesson:{lesson_id}")
+    try:
+        snapshot = await _active_sessions(db, models.Session.lesson_id == lesson_id)
+        await db.close()
+    except BaseException:
+        events.bus.unsubscribe(subscription)
+        raise
+    await _stream(websocket, subscription, snapshot)
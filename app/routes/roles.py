@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlalchemy.orm import Session
 from .. import models, schemas, database
 from ..dependencies import require_role, get_current_user
+from ..principals import Principal, invalidate_user
+from ..pagination import PageParams
 
 router = APIRouter()
 
@@ -41,7 +43,7 @@ def bootstrap_admin(db: Session = Depends(database.get_db)):
 
 @router.post("/", response_model=schemas.Role)
 def create_role(role: schemas.RoleBase, db: Session = Depends(database.get_db),
-                admin: models.User = Depends(require_role("admin"))):
+                admin: Principal = Depends(require_role("admin"))):
     existing_role = db.query(models.Role).filter(models.Role.name == role.name).first()
     if existing_role:
         raise HTTPException(status_code=400, detail="Role already exists")
@@ -54,14 +56,16 @@ def create_role(role: schemas.RoleBase, db: Session = Depends(database.get_db),
 
 
 @router.get("/", response_model=list[schemas.Role])
-def list_roles(db: Session = Depends(database.get_db),
-               user: models.User = Depends(get_current_user)):
-    return db.query(models.Role).all()
+def list_roles(request: Request, response: Response,
+               page: PageParams = Depends(),
+               db: Session = Depends(database.get_db),
+               user: Principal = Depends(get_current_user)):
+    return page.finish(page.apply(db.query(models.Role), models.Role.id).all(), request, response)
 
 
 @router.post("/assign/{user_id}/{role_id}")
 def assign_role(user_id: int, role_id: int, db: Session = Depends(database.get_db),
-                admin: models.User = Depends(require_role("admin"))):
+                admin: Principal = Depends(require_role("admin"))):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     role = db.query(models.Role).filter(models.Role.id == role_id).first()
 
@@ -71,4 +75,5 @@ def assign_role(user_id: int, role_id: int, db: Session = Depends(database.get_d
     if role not in user.roles:
         user.roles.append(role)
         db.commit()
+        invalidate_user(user.id)
     return {"message": f"Role '{role.name}' assigned to user '{user.username}'"}
\ No newline at end of file
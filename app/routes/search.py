@@ -0,0 +1,31 @@
+from typing import List, Literal
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from .. import models, schemas, database, search
+from ..dependencies import get_current_user
+from ..principals import Principal
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[schemas.SearchResult])
+def search_material(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Literal["lesson", "course"] | None = None,
+    limit: int = Query(20, ge=1, le=50),
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Search lesson titles/content and course titles, best matches first.
+    Only classrooms you own or are enrolled in are searched (admins: all).
+    """
+    if "admin" in current_user.role_names:
+        classroom_ids = None
+    else:
+        owned = db.execute(
+            select(models.Classroom.id).where(models.Classroom.instructor_id == current_user.id)
+        ).scalars()
+        classroom_ids = set(current_user.enrolled_classroom_ids) | set(owned)
+    return search.search(db, q, classroom_ids, kind=kind, limit=limit)
@@ -1,13 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
-from .. import models, schemas, database
+from .. import models, schemas, database, access, analytics, events
 from ..dependencies import get_current_user, require_role
+from ..principals import Principal
+from ..pagination import PageParams
+from ..writebuffer import session_starts, write_session_starts
 from typing import List
 
 router = APIRouter()
 
 
+class SessionFilters:
+    """Server-side filters shared by the session list endpoints."""
+
+    def __init__(
+        self,
+        is_active: bool | None = None,
+        lesson_id: int | None = None,
+        started_after: datetime | None = None,
+        started_before: datetime | None = None,
+    ):
+        self.is_active = is_active
+        self.lesson_id = lesson_id
+        self.started_after = started_after
+        self.started_before = started_before
+
+    def apply(self, query):
+        if self.is_active is not None:
+            query = query.where(models.Session.is_active == self.is_active)
+        if self.lesson_id is not None:
+            query = query.where(models.Session.lesson_id == self.lesson_id)
+        if self.started_after is not None:
+            query = query.where(models.Session.start_time >= self.started_after)
+        if self.started_before is not None:
+            query = query.where(models.Session.start_time < self.started_before)
+        return query
+
+
 # ----------------------------
 # Create a session (Instructor only)
 # ----------------------------
@@ -15,28 +48,31 @@ router = APIRouter()
 def create_session(
     session_data: schemas.SessionCreate,
     db: Session = Depends(database.get_db),
-    instructor: models.User = Depends(require_role("instructor"))
+    instructor: Principal = Depends(require_role("instructor"))
 ):
     """
     Instructors can create a new session for their lessons.
     """
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == session_data.lesson_id).first()
-    if not lesson:
-        raise HTTPException(status_code=404, detail="Lesson not found")
-
     # Ensure instructor owns the classroom of this lesson
-    if lesson.classroom.instructor_id != instructor.id:
-        raise HTTPException(status_code=403, detail="You are not the instructor of this classroom")
+    access.authorize(
+        db, models.Lesson, session_data.lesson_id,
+        access.owns_lesson(instructor.id, session_data.lesson_id),
+        forbidden="You are not the instructor of this classroom"
+    )
 
+    start_time = session_data.start_time or datetime.utcnow()
     session = models.Session(
         lesson_id=session_data.lesson_id,
-        start_time=session_data.start_time,
+        start_time=start_time,
+        last_seen_at=start_time,
         is_active=session_data.is_active
     )
 
     db.add(session)
+    analytics.session_started(db, session)
     db.commit()
     db.refresh(session)
+    events.publish_all(events.session_messages(db, "session_started", [events.session_state(session)]))
     return session
 
 
@@ -44,33 +80,76 @@ def create_session(
 # Student starts a session
 # -----------------------------
 @router.post("/start/{lesson_id}", response_model=schemas.Session)
-def start_session(
+async def start_session(
     lesson_id: int,
-    db: Session = Depends(database.get_db),
-    student: models.User = Depends(require_role("student"))
+    db: AsyncSession = Depends(database.get_async_db),
+    student: Principal = Depends(require_role("student"))
 ):
     """
     Students can start a session for a lesson they are enrolled in.
     """
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
-    if not lesson:
-        raise HTTPException(status_code=404, detail="Lesson not found")
-
     # Ensure student is enrolled in the classroom
-    if lesson.classroom not in student.enrolled_classrooms:
-        raise HTTPException(status_code=403, detail="You are not enrolled in this classroom")
-
-    new_session = models.Session(
-        lesson_id=lesson.id,
-        start_time=datetime.utcnow(),
-        is_active=True
+    await access.aauthorize(
+        db, models.Lesson, lesson_id,
+        access.enrolled_in_lesson(student.id, lesson_id),
+        forbidden="You are not enrolled in this classroom",
+        entity=models.Lesson.id
     )
+    await db.close() # the write below uses its own session
+
+    row = {"lesson_id": lesson_id, "student_id": student.id}
+    if session_starts.running:
+        # Group commit with whoever else is starting right now
+        return await session_starts.submit(row)
+    return (await asyncio.to_thread(write_session_starts, [row]))[0]
 
-    db.add(new_session)
+# -----------------------------
+# Student keeps a session alive / ends it
+# -----------------------------
+@router.post("/{session_id}/heartbeat", response_model=schemas.Session)
+def heartbeat(
+    session_id: int,
+    db: Session = Depends(database.get_db),
+    student: Principal = Depends(require_role("student"))
+):
+    """
+    For clients that keep a lesson open: call this every few minutes. With
+    SESSION_IDLE_TIMEOUT_MINUTES set, sessions without a heartbeat for that
+    long are closed by the sweeper, ending at their last heartbeat. The
+    bundled pages don't send heartbeats yet.
+    """
+    session = access.authorize(
+        db, models.Session, session_id,
+        access.started_session(student.id, session_id),
+        forbidden="This is not your session"
+    )
+    if not session.is_active:
+        raise HTTPException(status_code=409, detail="Session has ended")
+    session.last_seen_at = datetime.utcnow()
     db.commit()
-    db.refresh(new_session)
+    db.refresh(session)
+    return session
 
-    return new_session
+@router.post("/{session_id}/end", response_model=schemas.Session)
+def end_session(
+    session_id: int,
+    db: Session = Depends(database.get_db),
+    student: Principal = Depends(require_role("student"))
+):
+    session = access.authorize(
+        db, models.Session, session_id,
+        access.started_session(student.id, session_id),
+        forbidden="This is not your session"
+    )
+    if session.is_active:
+        old_start_time, old_end_time = session.start_time, session.end_time
+        session.is_active = False
+        session.end_time = session.last_seen_at = datetime.utcnow()
+        analytics.session_changed(db, session, old_start_time, True, old_end_time)
+        db.commit()
+        db.refresh(session)
+        events.publish_all(events.session_messages(db, "session_ended", [events.session_state(session)]))
+    return session
 
 # -----------------------------
 # Instructor views sessions for a lesson
@@ -79,87 +158,107 @@ def start_session(
 def get_lesson_sessions(
     lesson_id: int,
     db: Session = Depends(database.get_db),
-    instructor: models.User = Depends(require_role("instructor"))
+    instructor: Principal = Depends(require_role("instructor"))
 ):
     """
     Instructors can see all sessions of their lessons.
     """
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
-    if not lesson:
-        raise HTTPException(status_code=404, detail="Lesson not found")
-
-    if lesson.classroom.instructor_id != instructor.id:
-        raise HTTPException(status_code=403, detail="You are not the instructor for this lesson")
-
-    return lesson.sessions
+    access.authorize(
+        db, models.Lesson, lesson_id,
+        access.owns_lesson(instructor.id, lesson_id),
+        forbidden="You are not the instructor for this lesson"
+    )
+    return db.query(models.Session).filter(models.Session.lesson_id == lesson_id).all()
 
 # -----------------------------
 # Admin can view all sessions (optional)
 # -----------------------------
 @router.get("/all", response_model=list[schemas.Session])
 def get_all_sessions(
+    request: Request,
+    response: Response,
+    filters: SessionFilters = Depends(),
+    page: PageParams = Depends(),
     db: Session = Depends(database.get_db),
-    admin: models.User = Depends(require_role("admin"))
+    admin: Principal = Depends(require_role("admin"))
 ):
     """
     Admins can view all sessions.
     """
-    return db.query(models.Session).all()
+    query = page.apply(filters.apply(db.query(models.Session)), models.Session.id)
+    return page.finish(query.all(), request, response)
 
 @router.get("/", response_model=List[schemas.Session])
-def get_sessions(db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
+async def get_sessions(
+    request: Request,
+    response: Response,
+    filters: SessionFilters = Depends(),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
     """
     - Students: only sessions for lessons in classrooms they are enrolled in
     - Instructors: only sessions for lessons in classrooms they own
     """
+    query = select(models.Session).join(models.Lesson).join(models.Course)
     if any(role.name == "instructor" for role in current_user.roles):
         # Instructor sees sessions of lessons in classrooms they own
-        sessions = db.query(models.Session).join(models.Lesson).join(models.Classroom).filter(
-            models.Classroom.instructor_id == current_user.id
-        ).all()
+        query = query.join(models.Classroom).where(models.Classroom.instructor_id == current_user.id)
     else:
         # Student sees sessions only in enrolled classrooms
-        sessions = db.query(models.Session).join(models.Lesson).join(models.Classroom).join(models.Classroom.students).filter(
-            models.User.id == current_user.id
-        ).all()
+        query = query.join(
+            models.classroom_students,
+            models.classroom_students.c.classroom_id == models.Course.classroom_id
+        ).where(models.classroom_students.c.student_id == current_user.id)
 
-    return sessions
+    query = page.apply(filters.apply(query), models.Session.id)
+    return page.finish((await db.execute(query)).scalars().all(), request, response)
 
 @router.put("/{session_id}", response_model=schemas.Session)
 def update_session(session_id: int, session_data: schemas.SessionCreate, db: Session = Depends(database.get_db),
-                   instructor: models.User = Depends(require_role("instructor"))):
+                   instructor: Principal = Depends(require_role("instructor"))):
     """
     Instructors can update session details for lessons they own.
     """
-    session = db.query(models.Session).filter(models.Session.id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    lesson = session.lesson
-    if lesson.classroom.instructor_id != instructor.id:
-        raise HTTPException(status_code=403, detail="You are not the instructor of this classroom")
+    session = access.authorize(
+        db, models.Session, session_id,
+        access.owns_session(instructor.id, session_id),
+        forbidden="You are not the instructor of this classroom"
+    )
 
-    session.start_time = session_data.start_time
+    old_start_time, old_is_active, old_end_time = session.start_time, session.is_active, session.end_time
+    if session_data.start_time is not None:
+        session.start_time = session_data.start_time
+    if session.is_active and not session_data.is_active:
+        session.end_time = datetime.utcnow()
+    elif session_data.is_active and not session.is_active:
+        # Reopened: give it a fresh idle window so the sweeper doesn't close it straight away
+        session.end_time = None
+        session.last_seen_at = datetime.utcnow()
     session.is_active = session_data.is_active
+    analytics.session_changed(db, session, old_start_time, old_is_active, old_end_time)
     db.commit()
     db.refresh(session)
+    events.publish_all(events.session_messages(db, "session_updated", [events.session_state(session)]))
     return session
 
 
 @router.delete("/{session_id}")
 def delete_session(session_id: int, db: Session = Depends(database.get_db),
-                   instructor: models.User = Depends(require_role("instructor"))):
+                   instructor: Principal = Depends(require_role("instructor"))):
     """
     Instructors can delete sessions for lessons they own.
     """
-    session = db.query(models.Session).filter(models.Session.id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    lesson = session.lesson
-    if lesson.classroom.instructor_id != instructor.id:
-        raise HTTPException(status_code=403, detail="You are not the instructor of this classroom")
+    session = access.authorize(
+        db, models.Session, session_id,
+        access.owns_session(instructor.id, session_id),
+        forbidden="You are not the instructor of this classroom"
+    )
 
+    analytics.session_deleted(db, session)
+    messages = events.session_messages(db, "session_deleted", [events.session_state(session)])
     db.delete(session)
     db.commit()
+    events.publish_all(messages)
     return {"message": f"Session {session.id} deleted successfully"}
\ No newline at end of file
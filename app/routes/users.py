@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from .. import models, schemas, database
-from ..hash import hash_password, verify_password
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
+from .. import models, schemas, database, access, events
+from ..hash import ahash_password, averify_password, needs_rehash
 from fastapi.security import OAuth2PasswordRequestForm
 from ..dependencies import require_role, create_access_token, get_current_user
+from ..principals import Principal, invalidate_user
 from ..models import Role
+from ..pagination import PageParams
 from typing import List
 
 
@@ -13,15 +17,15 @@ router = APIRouter()
 
 
 @router.post("/", response_model=schemas.User)
-def create_user(user_data: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    existing_user = db.query(models.User).filter(models.User.username == user_data.username).first()
+async def create_user(user_data: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
+    existing_user = await db.scalar(select(models.User.id).where(models.User.username == user_data.username))
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already registered")
 
-    hashed_pass = hash_password(user_data.password)
+    hashed_pass = await ahash_password(user_data.password)
 
     
-    target_role = db.query(Role).filter(Role.name == user_data.role).first()
+    target_role = await db.scalar(select(Role).where(Role.name == user_data.role))
     if not target_role:
         raise HTTPException(status_code=500, detail="Student role not initialized")
     new_user = models.User(
@@ -31,13 +35,21 @@ def create_user(user_data: schemas.UserCreate, db: Session = Depends(database.ge
         roles = [target_role]
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit() # expire_on_commit is off, so new_user.roles is still loaded
     return new_user
 
 @router.get("/", response_model=list[schemas.User])
-def get_users(db: Session = Depends(database.get_db)):
-    return db.query(models.User).all()
+def get_users(
+    request: Request,
+    response: Response,
+    role: str | None = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(database.get_db)
+):
+    query = db.query(models.User).options(selectinload(models.User.roles))
+    if role:
+        query = query.filter(models.User.roles.any(models.Role.name == role))
+    return page.finish(page.apply(query, models.User.id).all(), request, response)
 
 @router.delete("/{user_id}")
 def delete_user(user_id: int, db: Session = Depends(database.get_db)):
@@ -46,29 +58,34 @@ def delete_user(user_id: int, db: Session = Depends(database.get_db)):
         raise HTTPException(status_code=404, detail="User not found")
     db.delete(user)
     db.commit()
+    invalidate_user(user_id)
     return {"message": "User deleted successfully"}
 
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db :Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    user = await db.scalar(select(models.User).where(models.User.username == form_data.username))
+    if not user or not await averify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
+    # The work factor changed since this hash was made: upgrade it while we have the password
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = await ahash_password(form_data.password)
+        await db.commit()
     access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=schemas.User) # Adding the response_model helps catch errors
-def get_me(current_user: models.User = Depends(get_current_user)):
+async def get_me(current_user: Principal = Depends(get_current_user)):
     return current_user # FastAPI will automatically convert the DB model to the User schema
 
 @router.post("/join-request/{instructor_id}")
 def create_join_request(
     instructor_id: int,
     db: Session = Depends(database.get_db),
-    current_student: models.User = Depends(get_current_user)
+    current_student: Principal = Depends(get_current_user)
 ):
     # 1. Quick check: Is the target actually an instructor?
     instructor = db.query(models.User).filter(models.User.id == instructor_id).first()
@@ -102,32 +119,44 @@ def accept_request(
     request_id: int, 
     classroom_id: int, 
     db: Session = Depends(database.get_db),
-    instructor: models.User = Depends(require_role("instructor"))
+    instructor: Principal = Depends(require_role("instructor"))
 ):
     # 1. Find the request
     join_req = db.query(models.JoinRequest).filter(models.JoinRequest.id == request_id).first()
     if not join_req or join_req.instructor_id != instructor.id:
         raise HTTPException(status_code=404, detail="Request not found")
 
-    # 2. Find the classroom
-    classroom = db.query(models.Classroom).filter(models.Classroom.id == classroom_id).first()
+    # 2. Find the classroom (and make sure it's this instructor's)
+    access.authorize(
+        db, models.Classroom, classroom_id,
+        access.owns_classroom(instructor.id, classroom_id),
+        forbidden="You are not the instructor of this classroom"
+    )
     
     # 3. Perform assignment
-    student = db.query(models.User).get(join_req.student_id)
-    if student not in classroom.students:
-        classroom.students.append(student)
+    if not access.allowed(db, access.enrolled_in_classroom(join_req.student_id, classroom_id)):
+        db.execute(access.enrollments.insert().values(classroom_id=classroom_id, student_id=join_req.student_id))
     
     # 4. Finalize
     join_req.status = "accepted"
     db.commit()
+    invalidate_user(join_req.student_id)
+    events.publish_student_joined(classroom_id, join_req.student_id)
     return {"message": "Student assigned successfully"}
 
 @router.get("/my-requests", response_model=List[schemas.JoinRequestSchema]) # Add this!
 def get_my_requests(
+    request: Request,
+    response: Response,
+    status: str = "pending",
+    page: PageParams = Depends(),
     db: Session = Depends(database.get_db),
-    instructor: models.User = Depends(get_current_user)
+    instructor: Principal = Depends(get_current_user)
 ):
-    return db.query(models.JoinRequest).filter(
+    query = db.query(models.JoinRequest).options(
+        joinedload(models.JoinRequest.student).selectinload(models.User.roles)
+    ).filter(
         models.JoinRequest.instructor_id == instructor.id,
-        models.JoinRequest.status == "pending"
-    ).all()
\ No newline at end of file
+        models.JoinRequest.status == status
+    )
+    return page.finish(page.apply(query, models.JoinRequest.id).all(), request, response)
\ No newline at end of file
@@ -0,0 +1,188 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from .config import settings
+
+
+class QueueFullError(Exception):
+    """Raised when an LLM call can't even be queued. Turned into a 429/503 with Retry-After by main.py."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A granted LLM slot. release() is idempotent so streams can call it from a finally block."""
+
+    def __init__(self, scheduler: "LLMScheduler"):
+        self._scheduler = scheduler
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release()
+
+
+class LLMScheduler:
+    """
+    In-process admission control for LLM calls.
+
+    At most `max_concurrency` calls run at once. Everyone else waits in a
+    per-user queue and slots are handed out round-robin across users, so one
+    instructor generating ten lessons can't starve a class asking questions.
+    When the queue is full we fail fast instead of piling up requests.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_queued_per_user: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+
+        self._running = 0
+        self._queued = 0
+        self._waiters = OrderedDict() # user_key -> deque of futures
+
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.service_seconds_total = 0.0
+        self.service_count = 0
+
+    # -----------------------------
+    # Acquire / release
+    # -----------------------------
+    def _rejection(self, user_key: str) -> QueueFullError | None:
+        if self._running < self.max_concurrency and not self._queued:
+            return None
+        if self._queued >= self.max_queue:
+            return QueueFullError(503, "AI service is busy, please retry shortly", self._retry_after())
+        queue = self._waiters.get(user_key)
+        if queue is not None and len(queue) >= self.max_queued_per_user:
+            return QueueFullError(429, "Too many AI requests in progress for this user", self._retry_after())
+        return None
+
+    def check(self, user_key: str):
+        """
+        Raise QueueFullError now if `user_key` would be turned away, without
+        taking a slot. Streaming routes call this so they can still answer
+        429/503 before the body starts; the slot itself is taken by stream().
+        """
+        error = self._rejection(user_key)
+        if error is not None:
+            self.rejected += 1
+            raise error
+
+    async def acquire(self, user_key: str) -> Ticket:
+        started = time.monotonic()
+
+        self.check(user_key)
+        if self._running < self.max_concurrency and not self._queued:
+            self._running += 1
+        else:
+            await self._wait_in_queue(user_key)
+
+        waited = time.monotonic() - started
+        self.admitted += 1
+        self.wait_count += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        return Ticket(self)
+
+    async def _wait_in_queue(self, user_key: str):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user_key, deque()).append(future)
+        self._queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed to us just as we were cancelled: give it back
+                self._release()
+            else:
+                queue = self._waiters.get(user_key)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    self._queued -= 1
+                    if not queue:
+                        del self._waiters[user_key]
+            raise
+
+    def _release(self):
+        self._running -= 1
+        self._wake_next()
+
+    def _wake_next(self):
+        while self._waiters and self._running < self.max_concurrency:
+            user_key, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            self._queued -= 1
+            # Round-robin: this user goes to the back of the line
+            if queue:
+                self._waiters.move_to_end(user_key)
+            else:
+                del self._waiters[user_key]
+            if future.cancelled():
+                continue
+            self._running += 1
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, user_key: str):
+        ticket = await self.acquire(user_key)
+        started = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            self.record_service_time(time.monotonic() - started)
+            ticket.release()
+
+    async def stream(self, user_key: str, chunks):
+        """
+        Pass an LLM stream through, holding a slot from the first chunk pulled
+        until it finishes or the client goes away. The slot is taken here, not
+        in the route: a response whose body never starts holds nothing.
+        """
+        async with self.slot(user_key):
+            async for chunk in chunks:
+                yield chunk
+
+    # -----------------------------
+    # Metrics
+    # -----------------------------
+    def record_service_time(self, seconds: float):
+        self.service_count += 1
+        self.service_seconds_total += seconds
+
+    def _retry_after(self) -> int:
+        avg_service = self.service_seconds_total / self.service_count if self.service_count else 10.0
+        backlog = self._queued / max(self.max_concurrency, 1) + 1
+        return max(1, math.ceil(avg_service * backlog))
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "queued": self._queued,
+            "queued_users": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_seconds_avg": round(self.wait_seconds_total / self.wait_count, 4) if self.wait_count else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 4),
+            "service_seconds_avg": round(self.service_seconds_total / self.service_count, 4) if self.service_count else 0.0,
+        }
+
+
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_queue=settings.LLM_MAX_QUEUE,
+    max_queued_per_user=settings.LLM_MAX_QUEUED_PER_USER,
+)
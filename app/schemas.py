@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, computed_field
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 
 
@@ -42,6 +42,15 @@ class Lesson(BaseModel):
     class Config:
         from_attributes = True
 
+class LessonSummary(BaseModel):
+    """Lesson without its body, for classroom/course listings."""
+    id: int
+    title: str
+    course_id: int
+    has_content: bool
+    class Config:
+        from_attributes = True
+
 class CourseCreate(BaseModel):
     title: str
     classroom_id: int
@@ -55,6 +64,15 @@ class Course(BaseModel):
         from_attributes = True
 
 
+class CourseSummary(BaseModel):
+    id: int
+    title: str
+    classroom_id: int
+    lessons: List[LessonSummary] = []
+    class Config:
+        from_attributes = True
+
+
 class ClassroomCreate(BaseModel):
     name: str
 
@@ -67,6 +85,15 @@ class Classroom(BaseModel):
     class Config:
         from_attributes = True
 
+class ClassroomSummary(BaseModel):
+    id: int
+    name: str
+    instructor_id: int
+    courses: List[CourseSummary] = []
+
+    class Config:
+        from_attributes = True
+
 class AIQuestionRequest(BaseModel):
     lesson_id: int
     question: str
@@ -78,16 +105,48 @@ class Session(BaseModel):
     lesson_id: int
     start_time: datetime
     is_active: bool
+    student_id: int | None = None
+    last_seen_at: datetime | None = None
+    end_time: datetime | None = None
 
     class Config:
         from_attributes = True
 
+class DailySessions(BaseModel):
+    day: date
+    sessions: int
+
+class LessonActivity(BaseModel):
+    lesson_id: int
+    sessions_started: int
+    active_now: int
+
+class SearchResult(BaseModel):
+    kind: str # "lesson" or "course"
+    id: int
+    course_id: int | None = None
+    classroom_id: int | None = None
+    title: str | None = None # HTML-escaped, matches wrapped in <mark>
+    snippet: str | None = None
+    score: float | None = None # higher is better; None on the LIKE fallback
+
+class SessionAnalytics(BaseModel):
+    sessions_started: int
+    active_now: int
+    distinct_students: int
+    sessions_ended: int
+    average_duration_seconds: float | None = None
+    daily: list[DailySessions]
+    hourly: list[int] # 24 buckets, UTC hour of day
+    lessons: list[LessonActivity] | None = None # classroom reports only
+
 class SessionBase(BaseModel):
     lesson_id: int
 
 class SessionCreate(SessionBase):
     # Optional: you can let start_time be provided or default
     start_time: datetime = None
+    is_active: bool = True
 
 
 class User(BaseModel):
@@ -123,4 +182,25 @@ class ContentGenerationRequest(BaseModel):
     prompt: str
 
 class ContentGenerationResponse(BaseModel):
-    content: str
\ No newline at end of file
+    content: str
+
+class GenerationJobCreate(BaseModel):
+    prompt: str
+    course_id: Optional[int] = None
+    save_as_lesson: bool = False
+    title: Optional[str] = None
+
+class GenerationJob(BaseModel):
+    id: str
+    status: str
+    course_id: Optional[int] = None
+    save_as_lesson: bool
+    result: Optional[str] = None
+    error: Optional[str] = None
+    lesson_id: Optional[int] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,231 @@
+import html
+import logging
+import re
+from sqlalchemy import inspect, or_, select, text
+from sqlalchemy.exc import OperationalError
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Full-text search (SQLite FTS5)
+# -----------------------------
+# One FTS5 table holds every lesson (rowid = 2 * id) and course
+# (rowid = 2 * id + 1). Triggers on lessons/courses keep it in sync, so
+# every write path (ORM, Core bulk inserts, imports) is covered.
+#
+# `scope` holds a token naming the classroom ("c12"). Searching ANDs the
+# caller's query with scope:("c3" OR "c12"), so FTS5 intersects posting
+# lists instead of ranking every match in the database and filtering after.
+# Databases without FTS5 fall back to LIKE (see search()).
+
+SEARCH_TABLE = "search_index"
+
+MARK_START, MARK_END = "\x02", "\x03" # swapped for <mark> after escaping
+
+SEARCH_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        title, body, scope,
+        kind UNINDEXED, object_id UNINDEXED, course_id UNINDEXED, classroom_id UNINDEXED,
+        tokenize = 'porter unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )""",
+    # Lessons
+    f"""CREATE TRIGGER IF NOT EXISTS search_lesson_insert AFTER INSERT ON lessons BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, title, body, scope, kind, object_id, course_id, classroom_id)
+        SELECT NEW.id * 2, NEW.title, coalesce(NEW.content, ''), 'c' || courses.classroom_id,
+               'lesson', NEW.id, NEW.course_id, courses.classroom_id
+        FROM (SELECT 1) LEFT JOIN courses ON courses.id = NEW.course_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_lesson_update AFTER UPDATE OF title, content, course_id ON lessons BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id * 2;
+        INSERT INTO {SEARCH_TABLE} (rowid, title, body, scope, kind, object_id, course_id, classroom_id)
+        SELECT NEW.id * 2, NEW.title, coalesce(NEW.content, ''), 'c' || courses.classroom_id,
+               'lesson', NEW.id, NEW.course_id, courses.classroom_id
+        FROM (SELECT 1) LEFT JOIN courses ON courses.id = NEW.course_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_lesson_delete AFTER DELETE ON lessons BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id * 2;
+    END""",
+    # Courses (a course moving classroom re-scopes its lessons too)
+    f"""CREATE TRIGGER IF NOT EXISTS search_course_insert AFTER INSERT ON courses BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, title, body, scope, kind, object_id, course_id, classroom_id)
+        VALUES (NEW.id * 2 + 1, coalesce(NEW.title, ''), '', 'c' || NEW.classroom_id,
+                'course', NEW.id, NEW.id, NEW.classroom_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_course_update AFTER UPDATE OF title, classroom_id ON courses BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id * 2 + 1;
+        INSERT INTO {SEARCH_TABLE} (rowid, title, body, scope, kind, object_id, course_id, classroom_id)
+        VALUES (NEW.id * 2 + 1, coalesce(NEW.title, ''), '', 'c' || NEW.classroom_id,
+                'course', NEW.id, NEW.id, NEW.classroom_id);
+        UPDATE {SEARCH_TABLE} SET scope = 'c' || NEW.classroom_id, classroom_id = NEW.classroom_id
+        WHERE OLD.classroom_id IS NOT NEW.classroom_id
+          AND rowid IN (SELECT id * 2 FROM lessons WHERE course_id = NEW.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_course_delete AFTER DELETE ON courses BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id * 2 + 1;
+    END""",
+]
+
+BACKFILL = [
+    f"DELETE FROM {SEARCH_TABLE}",
+    f"""INSERT INTO {SEARCH_TABLE} (rowid, title, body, scope, kind, object_id, course_id, classroom_id)
+        SELECT lessons.id * 2, lessons.title, coalesce(lessons.content, ''), 'c' || courses.classroom_id,
+               'lesson', lessons.id, lessons.course_id, courses.classroom_id
+        FROM lessons LEFT JOIN courses ON courses.id = lessons.course_id""",
+    f"""INSERT INTO {SEARCH_TABLE} (rowid, title, body, scope, kind, object_id, course_id, classroom_id)
+        SELECT id * 2 + 1, coalesce(title, ''), '', 'c' || classroom_id, 'course', id, id, classroom_id
+        FROM courses""",
+]
+
+
+def create_index(connection) -> bool:
+    """Create the FTS5 table and triggers and fill it. False if this database can't."""
+    if connection.dialect.name != "sqlite":
+        return False
+    try:
+        connection.execute(text("SAVEPOINT search_index"))
+        for statement in SEARCH_DDL + BACKFILL:
+            connection.execute(text(statement))
+        connection.execute(text("RELEASE SAVEPOINT search_index"))
+    except OperationalError as e: # SQLite built without FTS5
+        connection.execute(text("ROLLBACK TO SAVEPOINT search_index"))
+        logger.warning("Full-text search unavailable, falling back to LIKE: %s", e)
+        return False
+    return True
+
+
+_has_index = {} # engine url -> bool, checked once per engine
+
+
+def has_index(connection) -> bool:
+    key = str(connection.engine.url)
+    if key not in _has_index:
+        _has_index[key] = connection.dialect.name == "sqlite" and inspect(connection).has_table(SEARCH_TABLE)
+    return _has_index[key]
+
+
+# -----------------------------
+# Queries
+# -----------------------------
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# Words in nearly every lesson. They don't narrow anything down, and bm25
+# has to walk their whole posting list (every lesson) to weigh them.
+STOP_WORDS = frozenset("""
+    a an and are as at be by for from has have how in is it its of on or that the this to was were what
+    when where which who why will with
+""".split())
+
+
+def match_expression(query: str, classroom_ids: set[int] | None) -> str | None:
+    """
+    Turn free text into an FTS5 MATCH expression: every word must appear
+    (the last one as a prefix, for search-as-you-type), quoted so user input
+    can't use FTS syntax. Stop words are dropped unless that leaves nothing.
+    None if there's nothing to search for.
+    """
+    words = _WORD.findall(query)
+    words = [word for word in words if word.lower() not in STOP_WORDS] or words
+    if not words:
+        return None
+    phrases = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+    expression = "{title body} : (" + " ".join(phrases) + ")"
+    if classroom_ids is not None:
+        expression += " AND scope : (" + " OR ".join(f'"c{i}"' for i in sorted(classroom_ids)) + ")"
+    return expression
+
+
+def _marked(fragment: str) -> str:
+    return html.escape(fragment).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def _fts_search(db, query: str, classroom_ids, kind: str | None, limit: int) -> list[dict]:
+    expression = match_expression(query, classroom_ids)
+    if expression is None:
+        return []
+    sql = f"""
+        SELECT kind, object_id, course_id, classroom_id,
+               highlight({SEARCH_TABLE}, 0, :start, :end) AS title,
+               snippet({SEARCH_TABLE}, 1, :start, :end, '…', 16) AS snippet,
+               bm25({SEARCH_TABLE}, 10.0, 1.0, 0.0) AS score
+        FROM {SEARCH_TABLE}
+        WHERE {SEARCH_TABLE} MATCH :expression {"AND kind = :kind" if kind else ""}
+        ORDER BY score
+        LIMIT :limit
+    """
+    rows = db.execute(text(sql), {
+        "expression": expression, "kind": kind, "limit": limit, "start": MARK_START, "end": MARK_END,
+    }).all()
+    return [
+        {
+            "kind": row.kind,
+            "id": row.object_id,
+            "course_id": row.course_id,
+            "classroom_id": row.classroom_id,
+            "title": _marked(row.title),
+            "snippet": _marked(row.snippet) if row.snippet else None,
+            "score": round(-row.score, 3), # bm25 is "lower is better"
+        }
+        for row in rows
+    ]
+
+
+def _excerpt(content: str | None, words: list[str], width: int = 80) -> str | None:
+    if not content:
+        return None
+    lowered = content.lower()
+    positions = [p for p in (lowered.find(word.lower()) for word in words) if p >= 0]
+    start = max(0, min(positions) - width // 2) if positions else 0
+    fragment = content[start:start + width]
+    for word in words:
+        fragment = re.sub(f"({re.escape(word)})", MARK_START + r"\1" + MARK_END, fragment, flags=re.IGNORECASE)
+    return ("…" if start else "") + _marked(fragment) + ("…" if start + width < len(content) else "")
+
+
+def _like_search(db, query: str, classroom_ids, kind: str | None, limit: int) -> list[dict]:
+    """No FTS5 (e.g. PostgreSQL, MySQL): substring match on every word, no ranking beyond title hits first."""
+    words = _WORD.findall(query)
+    if not words:
+        return []
+    results = []
+    if kind in (None, "course"):
+        courses = select(models.Course.id, models.Course.title, models.Course.classroom_id).where(
+            *[models.Course.title.ilike(f"%{word}%") for word in words]
+        )
+        if classroom_ids is not None:
+            courses = courses.where(models.Course.classroom_id.in_(classroom_ids))
+        for row in db.execute(courses.limit(limit)).all():
+            results.append({
+                "kind": "course", "id": row.id, "course_id": row.id, "classroom_id": row.classroom_id,
+                "title": _excerpt(row.title, words, width=len(row.title or "")), "snippet": None, "score": None,
+            })
+    if kind in (None, "lesson"):
+        lessons = (
+            select(models.Lesson.id, models.Lesson.title, models.Lesson.content, models.Lesson.course_id, models.Course.classroom_id)
+            .join(models.Course, models.Course.id == models.Lesson.course_id)
+            .where(*[or_(models.Lesson.title.ilike(f"%{w}%"), models.Lesson.content.ilike(f"%{w}%")) for w in words])
+        )
+        if classroom_ids is not None:
+            lessons = lessons.where(models.Course.classroom_id.in_(classroom_ids))
+        for row in db.execute(lessons.limit(limit)).all():
+            results.append({
+                "kind": "lesson", "id": row.id, "course_id": row.course_id, "classroom_id": row.classroom_id,
+                "title": _excerpt(row.title, words, width=len(row.title or "")), "snippet": _excerpt(row.content, words),
+                "score": None,
+            })
+    # Title hits first
+    results.sort(key=lambda r: "<mark>" not in (r["title"] or ""))
+    return results[:limit]
+
+
+def search(db, query: str, classroom_ids: set[int] | None, kind: str | None = None, limit: int = 20) -> list[dict]:
+    """
+    Ranked matches for `query` among lessons/courses in `classroom_ids`
+    (None: everywhere, for admins).
+    """
+    if classroom_ids is not None and not classroom_ids:
+        return []
+    if has_index(db.connection()):
+        return _fts_search(db, query, classroom_ids, kind, limit)
+    return _like_search(db, query, classroom_ids, kind, limit)
@@ -0,0 +1,101 @@
+// Shared by the lesson view and the AI architect: reading the /stream
+// endpoints and showing the markdown the model writes while it arrives.
+
+// Reads a text/event-stream response and calls onText for every chunk
+async function readEventStream(response, onText) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = "message", data = "";
+            frame.split("\n").forEach(line => {
+                if (line.startsWith("event: ")) event = line.slice(7);
+                else if (line.startsWith("data: ")) data += line.slice(6);
+            });
+            const payload = data ? JSON.parse(data) : {};
+            if (event === "error") throw new Error(payload.detail || "Stream error");
+            if (event === "message") onText(payload.text);
+        }
+    }
+}
+
+// Small markdown renderer for model output: headings, paragraphs, lists,
+// code blocks, `code`, **bold** and *italic*. Everything is HTML-escaped
+// first and only these tags are produced, so the text can't inject markup.
+// Unfinished syntax (an open ``` block, a lone **) shows as typed until the
+// rest of it streams in.
+function escapeHtml(text) {
+    return text.replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;")
+        .replace(/"/g, "&quot;").replace(/'/g, "&#39;");
+}
+
+function renderInline(text) {
+    return text.split(/(`[^`]+`)/).map((part, i) => {
+        if (i % 2) return "<code>" + escapeHtml(part.slice(1, -1)) + "</code>";
+        return escapeHtml(part)
+            .replace(/\*\*([^*]+)\*\*/g, "<strong>$1</strong>")
+            .replace(/(^|[^*])\*([^*\s][^*]*)\*/g, "$1<em>$2</em>");
+    }).join("");
+}
+
+function renderMarkdown(source) {
+    const html = [];
+    let paragraph = [];
+    let list = null; // "ul" or "ol" while inside a list
+    let code = null; // lines of an open ``` block
+
+    const closeParagraph = () => {
+        if (paragraph.length) html.push("<p>" + paragraph.map(renderInline).join("<br>") + "</p>");
+        paragraph = [];
+    };
+    const closeList = () => {
+        if (list) html.push(`</${list}>`);
+        list = null;
+    };
+    const closeCode = () => {
+        html.push("<pre><code>" + escapeHtml(code.join("\n")) + "</code></pre>");
+        code = null;
+    };
+
+    for (const line of source.split("\n")) {
+        if (code !== null) {
+            if (line.trim().startsWith("```")) closeCode();
+            else code.push(line);
+            continue;
+        }
+        const heading = line.match(/^(#{1,6})\s+(.*)$/);
+        const item = line.match(/^\s*(?:([-*+])|\d+[.)])\s+(.*)$/);
+        if (line.trim().startsWith("```")) {
+            closeParagraph(); closeList();
+            code = [];
+        } else if (heading) {
+            closeParagraph(); closeList();
+            const level = heading[1].length;
+            html.push(`<h${level}>${renderInline(heading[2])}</h${level}>`);
+        } else if (item) {
+            closeParagraph();
+            const kind = item[1] ? "ul" : "ol";
+            if (list !== kind) {
+                closeList();
+                html.push(`<${kind}>`);
+                list = kind;
+            }
+            html.push("<li>" + renderInline(item[2]) + "</li>");
+        } else if (!line.trim()) {
+            closeParagraph(); closeList();
+        } else {
+            closeList();
+            paragraph.push(line);
+        }
+    }
+    if (code !== null) closeCode();
+    closeParagraph(); closeList();
+    return html.join("");
+}
@@ -0,0 +1,37 @@
+import json
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    """Format one Server-Sent Event frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+def sse_response(request: Request, chunks) -> StreamingResponse:
+    """
+    Stream an async iterator of text chunks to the browser as SSE.
+
+    Every chunk becomes a `data: {"text": ...}` frame, followed by a final
+    `done` event. If the client goes away we stop pulling from `chunks`,
+    which closes the upstream LLM stream instead of generating for nobody.
+    """
+    async def event_stream():
+        try:
+            async for chunk in chunks:
+                if await request.is_disconnected():
+                    break
+                yield sse_event({"text": chunk})
+            else:
+                yield sse_event({}, event="done")
+        except Exception as e:
+            yield sse_event({"detail": str(e)}, event="error")
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
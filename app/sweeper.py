@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from .config import settings
+from .database import SessionLocal
+from . import analytics, events, models
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Stale session sweeper
+# -----------------------------
+# Students rarely end sessions themselves, so without this the active set
+# only grows. Each pass closes sessions that have been idle (no heartbeat)
+# or open for too long, in batches of SESSION_SWEEP_BATCH_SIZE: one short
+# transaction per batch, so the sweeper never holds the write lock for long.
+# A closed session ends at its last sign of life (last_seen_at). One that
+# never showed any (no heartbeat, no /end) ends where it started, and the
+# rollups leave it out of the ended/duration figures rather than guess.
+
+
+def _stale_conditions(now: datetime) -> list:
+    # One condition per partial index: each batch is an index range scan
+    conditions = []
+    if settings.SESSION_IDLE_TIMEOUT_MINUTES > 0:
+        conditions.append(models.Session.last_seen_at < now - timedelta(minutes=settings.SESSION_IDLE_TIMEOUT_MINUTES))
+    if settings.SESSION_MAX_DURATION_MINUTES > 0:
+        conditions.append(models.Session.start_time < now - timedelta(minutes=settings.SESSION_MAX_DURATION_MINUTES))
+    return conditions
+
+
+def _close_batch(db, condition, batch_size: int) -> tuple[int, int]:
+    """Close up to `batch_size` stale sessions. Returns (selected, actually closed)."""
+    sessions = models.Session.__table__
+    candidates = db.execute(
+        select(sessions.c.id, sessions.c.lesson_id, sessions.c.student_id, sessions.c.start_time, sessions.c.last_seen_at)
+        .where(sessions.c.is_active == True, condition)
+        .limit(batch_size)
+    ).all()
+    if not candidates:
+        return 0, 0
+
+    stmt = (
+        update(sessions)
+        .where(sessions.c.id.in_([row.id for row in candidates]), sessions.c.is_active == True)
+        .values(is_active=False, end_time=sessions.c.last_seen_at)
+    )
+    if db.get_bind().dialect.update_returning:
+        # Only count what we actually closed; a student may have ended one meanwhile
+        closed = db.execute(stmt.returning(
+            sessions.c.id, sessions.c.lesson_id, sessions.c.student_id, sessions.c.start_time, sessions.c.end_time
+        )).all()
+    else:
+        db.execute(stmt)
+        closed = [(row.id, row.lesson_id, row.student_id, row.start_time, row.last_seen_at) for row in candidates]
+    analytics.sessions_closed(db, [(lesson_id, start, end) for _, lesson_id, _, start, end in closed])
+    messages = events.session_messages(db, "session_ended", [
+        {
+            "id": session_id, "lesson_id": lesson_id, "student_id": student_id, "is_active": False,
+            "start_time": start.isoformat(), "end_time": end.isoformat() if end else None,
+        }
+        for session_id, lesson_id, student_id, start, end in closed
+    ])
+    db.commit()
+    events.publish_all(messages)
+    return len(candidates), len(closed)
+
+
+def close_stale_sessions(now: datetime = None, batch_size: int = None) -> int:
+    """One sweep. Returns how many sessions were closed."""
+    now = now or datetime.utcnow()
+    batch_size = batch_size or settings.SESSION_SWEEP_BATCH_SIZE
+    total = 0
+    db = SessionLocal()
+    try:
+        for condition in _stale_conditions(now):
+            while True:
+                selected, closed = _close_batch(db, condition, batch_size)
+                total += closed
+                if selected < batch_size:
+                    break
+    finally:
+        db.close()
+    return total
+
+
+async def sweep_sessions():
+    while True:
+        await asyncio.sleep(settings.SESSION_SWEEP_INTERVAL_SECONDS)
+        try:
+            closed = await asyncio.to_thread(close_stale_sessions)
+        except Exception:
+            logger.exception("Session sweep failed")
+            continue
+        if closed:
+            logger.info("Closed %d stale sessions", closed)
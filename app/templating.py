@@ -0,0 +1,38 @@
+import logging
+import os
+import tempfile
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from .assets import manifest
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "templates")
+
+
+def _bytecode_cache() -> FileSystemBytecodeCache:
+    cache_dir = settings.TEMPLATE_CACHE_DIR or os.path.join(tempfile.gettempdir(), "learning-platform-jinja")
+    os.makedirs(cache_dir, exist_ok=True)
+    return FileSystemBytecodeCache(cache_dir)
+
+
+# The one template environment every page route renders from
+env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(["html"]),
+    bytecode_cache=_bytecode_cache(),
+    auto_reload=settings.TEMPLATES_AUTO_RELOAD, # off in production: no stat() per render
+)
+env.globals["static_url"] = manifest.url
+
+templates = Jinja2Templates(env=env)
+
+
+def precompile_templates() -> int:
+    """Compile every template up front (or load it from the bytecode cache) so no request pays for it."""
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    logger.info("Compiled %d templates", len(names))
+    return len(names)
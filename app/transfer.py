@@ -0,0 +1,167 @@
+import asyncio
+import zlib
+from datetime import datetime
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select
+from .bulk import batches, iter_records
+from .database import SessionLocal
+from .responses import dumps
+from . import models
+
+# -----------------------------
+# Course/classroom export format
+# -----------------------------
+# NDJSON, one object per line, parents before children:
+#   {"type": "export", "format": 1, "exported_at": "..."}
+#   {"type": "classroom", "name": "..."}                   (classroom exports only)
+#   {"type": "course", "ref": 12, "title": "..."}
+#   {"type": "lesson", "course_ref": 12, "title": "...", "content": "..."}
+# `ref` is the course id in the source database; it only links lessons to
+# their course inside the file.
+EXPORT_FORMAT = 1
+LESSONS_PER_FETCH = 50
+
+
+def export_lines(classroom_id: int = None, course_id: int = None):
+    """
+    Generator of NDJSON lines for one classroom or one course. It opens its
+    own session (the response outlives the request's) and fetches lessons
+    in small slices of plain rows, so memory stays flat however big the
+    course is.
+    """
+    db = SessionLocal()
+    try:
+        yield dumps({"type": "export", "format": EXPORT_FORMAT, "exported_at": datetime.utcnow().isoformat()}) + b"\n"
+
+        if classroom_id is not None:
+            name = db.execute(select(models.Classroom.name).where(models.Classroom.id == classroom_id)).scalar_one()
+            yield dumps({"type": "classroom", "name": name}) + b"\n"
+            course_filter = models.Course.classroom_id == classroom_id
+        else:
+            course_filter = models.Course.id == course_id
+
+        courses = db.execute(
+            select(models.Course.id, models.Course.title).where(course_filter).order_by(models.Course.id)
+        ).all()
+        for course in courses:
+            yield dumps({"type": "course", "ref": course.id, "title": course.title}) + b"\n"
+            lessons = db.execute(
+                select(models.Lesson.title, models.Lesson.content)
+                .where(models.Lesson.course_id == course.id)
+                .order_by(models.Lesson.id)
+                .execution_options(yield_per=LESSONS_PER_FETCH)
+            )
+            for lesson in lessons:
+                yield dumps({"type": "lesson", "course_ref": course.id, "title": lesson.title, "content": lesson.content}) + b"\n"
+    finally:
+        db.close()
+
+
+def gzip_lines(lines):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # 31: gzip container
+    for line in lines:
+        data = compressor.compress(line)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_response(lines, filename: str, compress: str | None) -> StreamingResponse:
+    if compress == "gzip":
+        return StreamingResponse(
+            gzip_lines(lines),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.ndjson.gz"'},
+        )
+    return StreamingResponse(
+        lines,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.ndjson"'},
+    )
+
+
+# -----------------------------
+# Import
+# -----------------------------
+class CourseRecord(BaseModel):
+    ref: int
+    title: str
+
+
+class LessonRecord(BaseModel):
+    course_ref: int
+    title: str
+    content: str | None = None
+
+
+class CourseImport:
+    """
+    One import into a classroom. The upload is read and checked in full
+    first, with no database work, then written in one short transaction: a
+    slow upload never holds SQLite's write lock, and an import either lands
+    whole or not at all.
+    """
+
+    def __init__(self, classroom_id: int):
+        self.classroom_id = classroom_id
+        self.courses = {} # ref in the file -> title, in file order
+        self.lessons = [] # (course ref, title, content)
+        self.course_ids = {} # ref in the file -> new course id, once written
+
+    def read_batch(self, records: list):
+        for number, record in records:
+            if isinstance(record, Exception):
+                raise HTTPException(status_code=400, detail=f"Line {number}: unreadable ({record})")
+            try:
+                kind = record.get("type")
+                if kind == "course":
+                    course = CourseRecord.model_validate(record)
+                    if course.ref in self.courses:
+                        raise HTTPException(status_code=400, detail=f"Line {number}: course ref {course.ref} appears twice")
+                    self.courses[course.ref] = course.title
+                elif kind == "lesson":
+                    lesson = LessonRecord.model_validate(record)
+                    if lesson.course_ref not in self.courses:
+                        raise HTTPException(status_code=400, detail=f"Line {number}: lesson before its course (ref {lesson.course_ref})")
+                    self.lessons.append((lesson.course_ref, lesson.title, lesson.content))
+                elif kind in ("export", "classroom"):
+                    continue
+                else:
+                    raise HTTPException(status_code=400, detail=f"Line {number}: unknown record type {kind!r}")
+            except ValidationError as e:
+                raise HTTPException(status_code=400, detail=f"Line {number}: {e.errors()[0]['msg']}")
+
+    def write(self):
+        db = SessionLocal()
+        try:
+            if self.courses:
+                ids = db.execute(
+                    insert(models.Course).returning(models.Course.id, sort_by_parameter_order=True),
+                    [{"title": title, "classroom_id": self.classroom_id} for title in self.courses.values()]
+                ).scalars().all()
+                self.course_ids = dict(zip(self.courses, ids))
+            if self.lessons:
+                # Core executemany skips the ORM events, so the tutor's retrieval
+                # index for these lessons is built lazily on the first question
+                db.execute(insert(models.Lesson), [
+                    {"title": title, "content": content, "course_id": self.course_ids[ref]}
+                    for ref, title, content in self.lessons
+                ])
+            db.commit()
+        finally:
+            db.close()
+
+
+async def import_courses(request: Request, classroom_id: int) -> dict:
+    importer = CourseImport(classroom_id)
+    async for batch in batches(iter_records(request)):
+        importer.read_batch(batch)
+    await asyncio.to_thread(importer.write)
+    return {
+        "classroom_id": classroom_id,
+        "courses": len(importer.course_ids),
+        "lessons": len(importer.lessons),
+        "course_ids": list(importer.course_ids.values()),
+    }
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from datetime import datetime
+from sqlalchemy import insert
+from .config import settings
+from .database import SessionLocal
+from . import analytics, events, models
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Group commit for write bursts
+# -----------------------------
+# "Open lesson 3" makes a whole class hit POST /sessions/start at once. One
+# commit per request means hundreds of transactions queueing for SQLite's
+# single write lock. The buffer instead collects requests for a few
+# milliseconds (or until it has `max_rows`), writes them all in one
+# transaction and only then answers each caller, with its real id. While a
+# flush is running the next batch is already filling up.
+
+
+class WriteBuffer:
+    def __init__(self, write, max_rows: int, max_delay_ms: float):
+        self.write = write # sync: list of rows in, list of results (same order) out
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.pending = [] # (row, future)
+        self.has_rows = asyncio.Event()
+        self.full = asyncio.Event()
+        self.task = None
+        self.closing = False
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None
+
+    def start(self):
+        self.closing = False
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush what's left, then stop. Not a cancel: a flush in progress still answers its callers."""
+        if self.task is None:
+            return
+        self.closing = True
+        self.has_rows.set()
+        await self.task
+        self.task = None
+
+    async def submit(self, row: dict):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((row, future))
+        self.has_rows.set()
+        if len(self.pending) >= self.max_rows:
+            self.full.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self.has_rows.wait()
+            if not self.closing:
+                try:
+                    await asyncio.wait_for(self.full.wait(), timeout=self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            await self._flush()
+            if self.closing and not self.pending:
+                return
+
+    async def _flush(self):
+        batch, self.pending = self.pending[:self.max_rows], self.pending[self.max_rows:]
+        if not self.pending:
+            self.has_rows.clear()
+        if len(self.pending) < self.max_rows:
+            self.full.clear()
+        if not batch:
+            return
+        rows = [row for row, _ in batch]
+        try:
+            results = await asyncio.to_thread(self.write, rows)
+        except Exception:
+            logger.exception("Group commit of %d rows failed, retrying them one by one", len(rows))
+            results = []
+            for row in rows:
+                try:
+                    results.append((await asyncio.to_thread(self.write, [row]))[0])
+                except Exception as e:
+                    results.append(e)
+        for (_, future), result in zip(batch, results):
+            if future.done(): # caller went away
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+# -----------------------------
+# Session starts
+# -----------------------------
+def write_session_starts(rows: list[dict]) -> list[dict]:
+    """
+    Insert sessions for (lesson_id, student_id) rows in one transaction,
+    with their analytics counters, then publish them. Returns the sessions.
+    """
+    now = datetime.utcnow()
+    sessions = [
+        {
+            "lesson_id": row["lesson_id"], "student_id": row["student_id"], "start_time": now,
+            "last_seen_at": now, "is_active": True, "end_time": None,
+        }
+        for row in rows
+    ]
+    db = SessionLocal()
+    try:
+        ids = db.execute(
+            insert(models.Session).returning(models.Session.id, sort_by_parameter_order=True),
+            [{key: value for key, value in session.items() if key != "end_time"} for session in sessions]
+        ).scalars().all()
+        for session, session_id in zip(sessions, ids):
+            session["id"] = session_id
+        analytics.sessions_started(db, sessions)
+        messages = events.session_messages(db, "session_started", [
+            {
+                "id": s["id"], "lesson_id": s["lesson_id"], "student_id": s["student_id"], "is_active": True,
+                "start_time": s["start_time"].isoformat(), "end_time": None,
+            }
+            for s in sessions
+        ])
+        db.commit()
+    finally:
+        db.close()
+    events.publish_all(messages)
+    return sessions
+
+
+session_starts = WriteBuffer(
+    write_session_starts,
+    max_rows=settings.SESSION_START_FLUSH_ROWS,
+    max_delay_ms=settings.SESSION_START_FLUSH_MS,
+)
@@ -0,0 +1,115 @@
+import sqlite3
+from sqlalchemy import create_engine, inspect, text
+from app.migrations import MIGRATIONS, run_migrations
+
+LATEST = MIGRATIONS[-1][0]
+
+# The schema create_all() used to build before versioned migrations
+# (sql_LP_app.db as first committed), with a little data in it
+BASELINE = """
+CREATE TABLE roles (id INTEGER NOT NULL, name VARCHAR, description VARCHAR, PRIMARY KEY (id));
+CREATE INDEX ix_roles_id ON roles (id);
+CREATE UNIQUE INDEX ix_roles_name ON roles (name);
+CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR, email VARCHAR, hashed_password VARCHAR, PRIMARY KEY (id));
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE INDEX ix_users_id ON users (id);
+CREATE TABLE user_roles (
+    user_id INTEGER, role_id INTEGER,
+    FOREIGN KEY(user_id) REFERENCES users (id), FOREIGN KEY(role_id) REFERENCES roles (id)
+);
+CREATE TABLE classrooms (
+    id INTEGER NOT NULL, name VARCHAR NOT NULL, instructor_id INTEGER,
+    PRIMARY KEY (id), FOREIGN KEY(instructor_id) REFERENCES users (id)
+);
+CREATE INDEX ix_classrooms_id ON classrooms (id);
+CREATE TABLE join_requests (
+    id INTEGER NOT NULL, student_id INTEGER, instructor_id INTEGER, status VARCHAR,
+    PRIMARY KEY (id), FOREIGN KEY(student_id) REFERENCES users (id), FOREIGN KEY(instructor_id) REFERENCES users (id)
+);
+CREATE INDEX ix_join_requests_id ON join_requests (id);
+CREATE TABLE classroom_students (
+    classroom_id INTEGER, student_id INTEGER,
+    FOREIGN KEY(classroom_id) REFERENCES classrooms (id), FOREIGN KEY(student_id) REFERENCES users (id)
+);
+CREATE TABLE courses (
+    id INTEGER NOT NULL, title VARCHAR, classroom_id INTEGER,
+    PRIMARY KEY (id), FOREIGN KEY(classroom_id) REFERENCES classrooms (id)
+);
+CREATE INDEX ix_courses_id ON courses (id);
+CREATE TABLE lessons (
+    id INTEGER NOT NULL, title VARCHAR NOT NULL, content VARCHAR, course_id INTEGER,
+    PRIMARY KEY (id), FOREIGN KEY(course_id) REFERENCES courses (id)
+);
+CREATE INDEX ix_lessons_id ON lessons (id);
+CREATE TABLE sessions (
+    id INTEGER NOT NULL, lesson_id INTEGER, start_time DATETIME, is_active BOOLEAN,
+    PRIMARY KEY (id), FOREIGN KEY(lesson_id) REFERENCES lessons (id)
+);
+CREATE INDEX ix_sessions_id ON sessions (id);
+
+INSERT INTO roles VALUES (1, 'student', NULL), (2, 'instructor', NULL), (3, 'admin', NULL);
+INSERT INTO users VALUES (1, 'teacher', 't@example.com', 'x'), (2, 'pupil', 'p@example.com', 'x');
+INSERT INTO user_roles VALUES (1, 2), (2, 1), (2, 1);
+INSERT INTO classrooms VALUES (1, 'Biology', 1);
+INSERT INTO classroom_students VALUES (1, 2), (1, 2), (1, NULL);
+INSERT INTO join_requests VALUES (1, 2, 1, 'pending');
+INSERT INTO courses VALUES (1, 'Plants', 1);
+INSERT INTO lessons VALUES (1, 'Photosynthesis', 'Light becomes sugar.', 1);
+INSERT INTO sessions VALUES
+    (1, 1, '2026-01-05 09:00:00.000000', 1),
+    (2, 1, '2026-01-06 10:00:00.000000', 0);
+"""
+
+
+def baseline_engine(tmp_path):
+    path = tmp_path / "baseline.db"
+    connection = sqlite3.connect(path)
+    connection.executescript(BASELINE)
+    connection.close()
+    return create_engine(f"sqlite:///{path}")
+
+
+def test_upgrade_from_baseline(tmp_path):
+    engine = baseline_engine(tmp_path)
+    assert run_migrations(engine) == LATEST
+
+    inspector = inspect(engine)
+    session_indexes = {index["name"] for index in inspector.get_indexes("sessions")}
+    assert {
+        "ix_sessions_lesson_id", "ix_sessions_student_id", "ix_sessions_active_last_seen", "ix_sessions_active_start"
+    } <= session_indexes
+    assert "ix_sessions_is_active" not in session_indexes
+    assert "ix_join_requests_instructor_status" in {index["name"] for index in inspector.get_indexes("join_requests")}
+    for table in ("classroom_students", "user_roles"):
+        assert f"uq_{table}" in {index["name"] for index in inspector.get_indexes(table)}
+
+    with engine.connect() as connection:
+        def rows(sql):
+            return connection.execute(text(sql)).all()
+
+        assert rows("SELECT version FROM schema_version ORDER BY version") == [(n,) for n, _, _ in MIGRATIONS]
+        assert rows("SELECT id, username FROM users ORDER BY id") == [(1, "teacher"), (2, "pupil")]
+        assert rows("SELECT id, title, content, version FROM lessons") == [(1, "Photosynthesis", "Light becomes sugar.", 1)]
+        assert rows("SELECT id, status FROM join_requests") == [(1, "pending")]
+        # Duplicate and half-empty link rows collapse to one copy of each pair
+        assert rows("SELECT classroom_id, student_id FROM classroom_students") == [(1, 2)]
+        assert sorted(rows("SELECT user_id, role_id FROM user_roles")) == [(1, 2), (2, 1)]
+
+        sessions = rows("SELECT id, start_time, is_active, student_id, last_seen_at, end_time FROM sessions ORDER BY id")
+        assert [(id, is_active, student_id, end_time) for id, _, is_active, student_id, _, end_time in sessions] == [
+            (1, 1, None, None), (2, 0, None, None)
+        ]
+        assert all(last_seen_at == start_time for _, start_time, _, _, last_seen_at, _ in sessions)
+        # Rollups rebuilt from the existing sessions
+        assert rows("SELECT lesson_id, classroom_id, sessions, active, ended FROM lesson_stats") == [(1, 1, 2, 1, 0)]
+        assert rows("SELECT day, sessions FROM lesson_daily_stats ORDER BY day") == [("2026-01-05", 1), ("2026-01-06", 1)]
+
+    # Already up to date: nothing runs again
+    assert run_migrations(engine) == LATEST
+
+
+def test_fresh_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    assert run_migrations(engine) == LATEST
+    assert "ix_sessions_active_start" in {index["name"] for index in inspect(engine).get_indexes("sessions")}